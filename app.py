@@ -4,8 +4,18 @@ Run:  streamlit run app.py
 """
 import streamlit as st
 import re
-import latex2mathml.converter
-from docx_generator import generate_docx
+import uuid
+from latex_generator import (build_format, LAYOUT_TEXT_ONLY as TPL_TEXT_ONLY,
+                             LAYOUT_TWO_PARAGRAPHS as TPL_TWO_PARA, LAYOUT_FIGURES as TPL_FIGURES)
+from compile_pool import CompileRateLimited
+import image_pipeline
+import page_estimator
+import speculative
+import jobs
+import text_segments
+import validation
+from validation import word_count as _wc
+from tex_engine import TexEngineError
 import config as C
 
 # ── Page config  (wide so we have room for a preview pane) ───────────────────
@@ -15,6 +25,17 @@ st.set_page_config(
     layout="wide",
 )
 
+# ── Startup: precompile the LaTeX preamble once per server process ──────────
+@st.cache_resource(show_spinner=False)
+def _warm_latex_format():
+    return build_format()
+
+_warm_latex_format()
+
+# Stable per-browser-session id for compile rate limiting
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
 # ── CSS ───────────────────────────────────────────────────────────────────────
 st.markdown("""
 <style>
@@ -67,6 +88,8 @@ html, body, [class*="css"] { font-family: 'Inter', Arial, sans-serif; }
 .doc-page .doc-label { font-weight:bold; }
 .doc-page .doc-heading{ font-size:13px; font-weight:bold; margin:10px 0 4px 0; }
 .doc-page .doc-para   { margin-bottom:6px; text-align:justify; }
+.doc-page .math-error { color:#c62828; }
+.doc-page .thumb      { max-width:100%; max-height:100%; object-fit:contain; }
 .doc-page .fig-row    { display:flex; gap:10px; margin-top:10px; }
 .doc-page .fig-col    { flex:1; text-align:center; }
 .doc-page .fig-cap    { font-size:10px; font-style:italic; text-align:left; margin-top:3px; }
@@ -82,13 +105,14 @@ html, body, [class*="css"] { font-family: 'Inter', Arial, sans-serif; }
                 border-radius:10px; font-size:.75rem; font-weight:600; }
 .wc-badge-red { background:#ffebee; color:#c62828; padding:1px 7px;
                 border-radius:10px; font-size:.75rem; font-weight:600; }
+.fill-meter { display:inline-block; width:70px; height:7px; background:rgba(255,255,255,.25);
+              border-radius:4px; overflow:hidden; vertical-align:middle; margin-left:6px; }
+.fill-meter span { display:block; height:100%; }
+.fill-label { font-size:.75rem; font-weight:600; margin-left:4px; }
 </style>
 """, unsafe_allow_html=True)
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
-def _wc(text):
-    return len(text.split()) if text and text.strip() else 0
-
 def _badge(count, limit):
     cls = "wc-badge-red" if count > limit else "wc-badge-ok"
     return f'<span class="{cls}">{count}/{limit} words</span>'
@@ -97,23 +121,31 @@ def _wc_line(count, limit):
     cls = "wc-red" if count > limit else "wc-ok"
     return f'<div class="{cls}">{count} / {limit} words</div>'
 
-def _validate_email(email):
-    return "@" in email and "." in email.split("@")[-1]
-
-def _file_too_large(f):
-    return f is not None and len(f.getvalue()) > C.MAX_IMAGE_SIZE_MB * 1024 * 1024
+def _fill_meter(fill):
+    """Page-fill bar for the preview header, coloured by the estimator's verdict."""
+    color = {page_estimator.FITS: "#66bb6a", page_estimator.BORDERLINE: "#ffb300",
+             page_estimator.OVERFLOW: "#ef5350"}[page_estimator.verdict(fill)]
+    width = min(fill, 1.0) * 100
+    return (f'<span class="fill-meter"><span style="width:{width:.0f}%;background:{color}"></span></span>'
+            f'<span class="fill-label">~{fill:.0%} of page</span>')
 
 def _esc(text):
-    return (text or "").replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
+    return text_segments.escape_html(text)
+
+def _thumb(upload, label):
+    """Cached thumbnail <img> for an upload, or the placeholder label."""
+    if not upload:
+        return label
+    try:
+        return f'<img class="thumb" src="{image_pipeline.thumbnail_uri(upload)}" alt="{label}">'
+    except Exception:
+        return label  # Unreadable image: validation reports it on submit
 
 def _esc_keep_math(text):
-    """HTML-escape text but preserve $ signs so MathJax can find them."""
+    """HTML-escape text, rendering $...$ / $$...$$ math as MathML."""
     if not text:
         return ""
-    return (text
-            .replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;"))
+    return text_segments.to_html(text)
 
 # ── Layout constants ──────────────────────────────────────────────────────────
 LAYOUT_TEXT_ONLY = f"Text only — single paragraph (max {C.ABSTRACT_MAX_WORDS_TOTAL} words)"
@@ -201,6 +233,7 @@ with left:
 
     # ── Figures (Option 3 only) ───────────────────────────────────────────
     figure_1 = caption_1 = figure_2 = caption_2 = None
+    auto_shrink = False
     if is_figures:
         st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
         st.subheader("📊 Figures")
@@ -223,6 +256,9 @@ with left:
             c2_w = _wc(caption_2)
             st.markdown(_wc_line(c2_w, C.CAPTION_MAX_WORDS), unsafe_allow_html=True)
 
+        auto_shrink = st.checkbox("Shrink figures automatically if the page overflows",
+                                  help="Finds the largest figure size that still fits on one page.")
+
     # ── Submit button ─────────────────────────────────────────────────────
     st.markdown('<hr class="section-divider">', unsafe_allow_html=True)
     submitted = st.button("🚀 Validate & Generate Reports",
@@ -232,7 +268,7 @@ with left:
 #  RIGHT COLUMN — live document preview
 # ════════════════════════════════════════════════════════════════════════════
 with right:
-    # Build preview variables safely - preserve $ signs for MathJax
+    # Build preview variables safely - math is rendered to MathML server-side
     _name    = _esc_keep_math(student_name)   if 'student_name'     in dir() else ""
     _topic   = _esc_keep_math(research_topic) if 'research_topic'   in dir() else ""
     _prog    = _esc_keep_math(graduate_program) if 'graduate_program' in dir() else ""
@@ -258,6 +294,20 @@ with right:
 
     badge_html = _badge(wc_total, wc_limit)
 
+    # page-fill estimate (pure Python, cheap enough for every rerun)
+    try:
+        _fill = page_estimator.estimate_fill({
+            "student_name": student_name, "research_topic": research_topic,
+            "sponsor": sponsor, "degree": degree, "year": year,
+            "contact_email": contact_email, "advisor": advisor, "career_goal": career_goal,
+            "headshot": headshot, "abstract_p1": abstract_p1, "abstract_p2": abstract_p2,
+            "figure_1": figure_1, "caption_1": caption_1,
+            "figure_2": figure_2, "caption_2": caption_2,
+        })
+        fill_html = _fill_meter(_fill)
+    except Exception:
+        fill_html = ""
+
     # sponsor row
     sp_row = f'<div><span class="doc-label">Sponsor:</span> {_sp}</div>' if _sp else ""
 
@@ -274,13 +324,13 @@ with right:
               <div class="fig-col">
                 <div style="background:#e8ecf0;height:80px;border:1px solid #bbb;
                             display:flex;align-items:center;justify-content:center;
-                            font-size:9px;color:#888">Figure 1</div>
+                            font-size:9px;color:#888">""" + _thumb(figure_1, "Figure 1") + """</div>
                 <div class="fig-cap">""" + _esc_keep_math(caption_1 or "") + """</div>
               </div>
               <div class="fig-col">
                 <div style="background:#e8ecf0;height:80px;border:1px solid #bbb;
                             display:flex;align-items:center;justify-content:center;
-                            font-size:9px;color:#888">Figure 2</div>
+                            font-size:9px;color:#888">""" + _thumb(figure_2, "Figure 2") + """</div>
                 <div class="fig-cap">""" + _esc_keep_math(caption_2 or "") + """</div>
               </div>
             </div>"""
@@ -291,26 +341,19 @@ with right:
               <div style="background:#e8ecf0;height:90px;border:1px solid #bbb;
                           display:inline-block;width:55%;
                           display:flex;align-items:center;justify-content:center;
-                          font-size:9px;color:#888">Figure</div>
+                          font-size:9px;color:#888">""" + _thumb(figure_1 or figure_2, "Figure") + """</div>
               <div class="fig-cap" style="text-align:center;margin-top:3px">""" + cap + """</div>
             </div>"""
     else:
         figs_html = ""
 
     preview_html = f"""
-    <script>
-      MathJax = {{
-        tex: {{ inlineMath: [['$','$'], ['\\\\(','\\\\)']], displayMath: [['$$','$$'], ['\\\\[','\\\\]']] }},
-        svg: {{ fontCache: 'global' }}
-      }};
-    </script>
-    <script src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-svg.js" async></script>
     <div class="preview-wrap">
-      <div class="preview-header">📄 Live Preview &nbsp;{badge_html}</div>
+      <div class="preview-header">📄 Live Preview &nbsp;{badge_html} {fill_html}</div>
       <div class="preview-body">
         <div class="doc-page">
           <div class="header-row">
-            <div class="headshot-box">Photo</div>
+            <div class="headshot-box">{_thumb(headshot, "Photo")}</div>
             <div class="doc-info">
               <div class="doc-name">{_name or "<em style='color:#aaa'>Your Name</em>"}</div>
               <div><span class="doc-label">Research topic:</span> {_topic or "<em style='color:#aaa'>Research topic</em>"}</div>
@@ -332,125 +375,101 @@ with right:
     st.html(preview_html)
 
 # ════════════════════════════════════════════════════════════════════════════
-#  Post-submit validation & generation
+#  Validation (every rerun, so valid drafts can be compiled speculatively)
 # ════════════════════════════════════════════════════════════════════════════
-if submitted:
-    errors = []
-
-    required = {
-        "Full Name": student_name, "Graduate Program": graduate_program,
-        "Graduation Year": year, "Contact Email": contact_email,
-        "Advisor": advisor, "Research Topic": research_topic,
-        "Abstract": abstract_p1,
-    }
-    if is_two_paragraphs:
-        required["Abstract Paragraph 2"] = abstract_p2
+data = {
+    "layout":          TPL_FIGURES if is_figures else (TPL_TWO_PARA if is_two_paragraphs else TPL_TEXT_ONLY),
+    "student_name":    student_name.strip(),
+    "graduate_program": graduate_program.strip(),
+    "research_topic":  research_topic.strip(),
+    "sponsor":         (sponsor or "").strip(),
+    "degree":          degree,
+    "year":            year.strip(),
+    "contact_email":   contact_email.strip(),
+    "advisor":         advisor.strip(),
+    "career_goal":     career_goal,
+    "headshot":        headshot,
+    "abstract_p1":     abstract_p1.strip(),
+    "abstract_p2":     (abstract_p2 or "").strip(),
+    "figure_1":        figure_1,
+    "caption_1":       (caption_1 or "").strip(),
+    "figure_2":        figure_2,
+    "caption_2":       (caption_2 or "").strip(),
+}
 
-    for label, val in required.items():
-        if not val or not val.strip():
-            errors.append(f"**{label}** is required.")
+errors = validation.validate(data)
 
-    p1w = _wc(abstract_p1)
-    p2w = _wc(abstract_p2 or "")
-    total_w = p1w + p2w
 
-    if is_two_paragraphs:
-        if p1w > C.ABSTRACT_MAX_WORDS_P1:
-            errors.append(f"**Paragraph 1** exceeds {C.ABSTRACT_MAX_WORDS_P1} words ({p1w} used).")
-        if total_w > C.ABSTRACT_MAX_WORDS_TOTAL:
-            errors.append(f"**Total abstract** exceeds {C.ABSTRACT_MAX_WORDS_TOTAL} words ({total_w} used).")
-    elif is_figures:
-        if p1w > 200:
-            errors.append(f"**Abstract** exceeds 200 words ({p1w} used).")
+# ════════════════════════════════════════════════════════════════════════════
+#  Post-submit validation & generation (runs as a background job)
+# ════════════════════════════════════════════════════════════════════════════
+def _show_job_error(exc):
+    if isinstance(exc, ValueError) and "exceeds 1 page" in str(exc):
+        st.error("❌ **Page limit exceeded.** Please shorten your text or figures so everything fits on one page.")
+    elif isinstance(exc, CompileRateLimited):
+        st.warning(f"⏳ {exc}")
+    elif isinstance(exc, TexEngineError):
+        st.error(f"❌ **Compile aborted.** {exc}")
     else:
-        if p1w > C.ABSTRACT_MAX_WORDS_TOTAL:
-            errors.append(f"**Abstract** exceeds {C.ABSTRACT_MAX_WORDS_TOTAL} words ({p1w} used).")
-
-    topic_w = _wc(research_topic)
-    if topic_w > C.RESEARCH_TOPIC_MAX_WORDS:
-        errors.append(f"**Research Topic** exceeds {C.RESEARCH_TOPIC_MAX_WORDS} words ({topic_w} used).")
-        
-    c1_w = _wc(caption_1)
-    if c1_w > C.CAPTION_MAX_WORDS:
-        errors.append(f"**Caption 1** exceeds {C.CAPTION_MAX_WORDS} words ({c1_w} used).")
-        
-    c2_w = _wc(caption_2)
-    if c2_w > C.CAPTION_MAX_WORDS:
-        errors.append(f"**Caption 2** exceeds {C.CAPTION_MAX_WORDS} words ({c2_w} used).")
-
-    if contact_email and not _validate_email(contact_email):
-        errors.append("Please enter a valid **email address**.")
-    if year and (not year.strip().isdigit() or len(year.strip()) != 4):
-        errors.append("**Graduation Year** must be 4 digits.")
-    if not headshot:
-        errors.append("**Headshot** is required.")
-    elif _file_too_large(headshot):
-        errors.append(f"**Headshot** exceeds {C.MAX_IMAGE_SIZE_MB} MB.")
-    if _file_too_large(figure_1):
-        errors.append(f"**Figure 1** exceeds {C.MAX_IMAGE_SIZE_MB} MB.")
-    if _file_too_large(figure_2):
-        errors.append(f"**Figure 2** exceeds {C.MAX_IMAGE_SIZE_MB} MB.")
-    if figure_1 and not (caption_1 and caption_1.strip()):
-        errors.append("Provide a **caption for Figure 1**.")
-    if figure_2 and not (caption_2 and caption_2.strip()):
-        errors.append("Provide a **caption for Figure 2**.")
+        st.error(f"Error generating reports: {exc}")
+
+def _show_job_result(result):
+    scale = result["figure_scale"]
+    if scale < 1.0:
+        st.info(f"ℹ️ Figures were scaled to {scale:.0%} of their normal height to fit on one page.")
+    base_name = result["base_name"]
+    st.success("✅ Reports ready! Download below.")
+    d1, d2 = st.columns(2)
+    with d1:
+        st.download_button("📄 Download DOCX", data=result["docx"],
+            file_name=f"{base_name}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            use_container_width=True)
+    with d2:
+        st.download_button("📕 Download PDF", data=result["pdf"],
+            file_name=f"{base_name}.pdf",
+            mime="application/pdf",
+            use_container_width=True)
+
+@st.fragment(run_every=1.0)
+def _poll_job(job_id):
+    """Live progress; only this fragment reruns while the job works."""
+    job = jobs.manager.get(job_id)
+    if job is None or job.status in jobs.FINISHED:
+        st.rerun()  # Full rerun renders the final state once
+    icon = "⏳" if "busy" in job.message else "⚙️"
+    st.progress(job.progress, text=f"{icon} {job.message}")
+
+def _job_panel(job_id):
+    job = jobs.manager.get(job_id)
+    if job is None:
+        st.session_state.pop("job_id", None)  # Results expired
+    elif job.status == jobs.DONE:
+        _show_job_result(job.result)
+    elif job.status == jobs.FAILED:
+        _show_job_error(job.error)
+    elif job.status == jobs.CANCELLED:
+        st.warning("Report generation was cancelled. Click the button to try again.")
+    else:
+        _poll_job(job_id)
 
+if submitted:
     if errors:
+        st.session_state.pop("job_id", None)
         with left:
             for e in errors:
                 st.error(e)
     else:
-        with left:
-            with st.spinner("Generating reports…"):
-                data = {
-                    "student_name":    student_name.strip(),
-                    "graduate_program": graduate_program.strip(),
-                    "research_topic":  research_topic.strip(),
-                    "sponsor":         (sponsor or "").strip(),
-                    "degree":          degree,
-                    "year":            year.strip(),
-                    "contact_email":   contact_email.strip(),
-                    "advisor":         advisor.strip(),
-                    "career_goal":     career_goal,
-                    "headshot":        headshot,
-                    "abstract_p1":     abstract_p1.strip(),
-                    "abstract_p2":     (abstract_p2 or "").strip(),
-                    "figure_1":        figure_1,
-                    "caption_1":       (caption_1 or "").strip(),
-                    "figure_2":        figure_2,
-                    "caption_2":       (caption_2 or "").strip(),
-                }
-                try:
-                    from latex_generator import generate_pdf
-                    try:
-                        pdf_io = generate_pdf(data)
-                    except ValueError as ve:
-                        if "exceeds 1 page" in str(ve):
-                            st.error("❌ **Page limit exceeded.** Please shorten your text or figures so everything fits on one page.")
-                            st.stop()
-                        else:
-                            raise
-
-                    doc_io = generate_docx(data)
-
-                    parts     = student_name.strip().split()
-                    last      = parts[-1] if parts else "Unknown"
-                    first     = parts[0]  if len(parts) > 1 else ""
-                    prog      = graduate_program.strip().replace(" ", "")
-                    base_name = f"GS26_{last}_{first}_{prog}"
-
-                    st.success("✅ Reports ready! Download below.")
-                    d1, d2 = st.columns(2)
-                    with d1:
-                        st.download_button("📄 Download DOCX", data=doc_io.getvalue(),
-                            file_name=f"{base_name}.docx",
-                            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                            use_container_width=True)
-                    with d2:
-                        st.download_button("📕 Download PDF", data=pdf_io.getvalue(),
-                            file_name=f"{base_name}.pdf",
-                            mime="application/pdf",
-                            use_container_width=True)
-
-                except Exception as exc:
-                    st.error(f"Error generating reports: {exc}")
+        speculative.cancel(st.session_state.session_id)
+        st.session_state.job_id = jobs.manager.submit(
+            st.session_state.session_id, jobs.generate_reports, data,
+            job_key=f"{speculative.fingerprint(data)}:{auto_shrink}",
+            session_id=st.session_state.session_id, auto_shrink=auto_shrink)
+
+elif not errors:
+    # Valid draft: compile it in the background once the user stops typing
+    speculative.schedule(st.session_state.session_id, data)
+
+if not (submitted and errors) and st.session_state.get("job_id"):
+    with left:
+        _job_panel(st.session_state.job_id)
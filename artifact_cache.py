@@ -0,0 +1,139 @@
+"""
+artifact_cache.py — Content-addressed on-disk cache for generated reports.
+
+Artifacts (PDF, DOCX, ZIP) are stored under a key derived from everything
+that determines their bytes: the rendered source, the uploaded images and
+the config.py settings that affect output (OUTPUT_SETTINGS). Generators
+whose output is not fully determined by its source (DOCX, ZIP) add a format
+version that is bumped with the code. Writes are atomic (temp file +
+rename), so several Streamlit processes can safely share one cache directory.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+
+import config as C
+
+_last_eviction = 0.0
+
+
+# Settings in config.py that change the bytes of a generated artifact. Paths,
+# worker counts, timeouts and cache tuning are left out on purpose: changing
+# them must not invalidate the cache. Add any new formatting setting here.
+OUTPUT_SETTINGS = (
+    "FONT_NAME", "FONT_SIZE_BODY", "FONT_SIZE_HEADING", "FONT_SIZE_NAME",
+    "FONT_SIZE_CAPTION", "FONT_COLOR_HEX",
+    "SPACING_AFTER", "SPACING_BEFORE_SECTION", "LINE_SPACING", "TABLE_CELL_MARGIN_H",
+    "PAGE_MARGIN",
+    "HEADSHOT_WIDTH", "HEADSHOT_HEIGHT", "HEADER_GUTTER",
+    "FIGURE_MAX_WIDTH", "FIGURE_MAX_HEIGHT",
+    "IMAGE_DERIVATIVE_DPI", "IMAGE_JPEG_QUALITY",
+    "LATEX_MAX_PASSES",
+)
+
+
+def config_fingerprint() -> str:
+    """Hash of the config.py settings that affect output (OUTPUT_SETTINGS)."""
+    items = [(k, repr(getattr(C, k, None))) for k in OUTPUT_SETTINGS]
+    return hashlib.sha256(repr(items).encode("utf-8")).hexdigest()
+
+
+def cache_key(*parts) -> str:
+    """Build a cache key from str/bytes parts plus the config fingerprint."""
+    h = hashlib.sha256(config_fingerprint().encode("ascii"))
+    for part in parts:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        # Length prefix keeps ("ab", "c") distinct from ("a", "bc")
+        h.update(len(part).to_bytes(8, "big"))
+        h.update(part)
+    return h.hexdigest()
+
+
+def _path(key: str, kind: str) -> str:
+    return os.path.join(C.ARTIFACT_CACHE_DIR, kind, key[:2], f"{key}.{kind}")
+
+
+def get(key: str, kind: str):
+    """Return cached bytes for (key, kind), or None on a miss."""
+    if not C.ARTIFACT_CACHE_ENABLED:
+        return None
+    path = _path(key, kind)
+    try:
+        with open(path, "rb") as f:
+            payload = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # Mark as recently used for eviction
+    except OSError:
+        pass
+    return payload
+
+
+def put(key: str, kind: str, payload: bytes) -> None:
+    """Store bytes for (key, kind). Failures are ignored: the cache is optional."""
+    if not C.ARTIFACT_CACHE_ENABLED:
+        return
+    path = _path(key, kind)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        return
+    _maybe_evict()
+
+
+def _maybe_evict() -> None:
+    global _last_eviction
+    now = time.time()
+    if now - _last_eviction < C.ARTIFACT_CACHE_EVICT_INTERVAL_S:
+        return
+    _last_eviction = now
+    evict()
+
+
+def evict() -> None:
+    """Drop artifacts older than the max age, then the oldest beyond the size cap."""
+    now = time.time()
+    max_age = C.ARTIFACT_CACHE_MAX_AGE_HOURS * 3600
+    max_bytes = C.ARTIFACT_CACHE_MAX_MB * 1024 * 1024
+
+    entries = []
+    for root, _dirs, files in os.walk(C.ARTIFACT_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # Removed by another process
+            # Stale temp files are left behind only by crashed writers
+            if now - st.st_mtime > max_age:
+                _unlink(path)
+            elif not name.endswith(".tmp"):
+                entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _unlink(path)
+        total -= size
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
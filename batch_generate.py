@@ -0,0 +1,128 @@
+"""
+batch_generate.py — Regenerate reports for every submission in a manifest.
+
+    python batch_generate.py submissions.jsonl -o out/ [-j 8] [--no-docx]
+
+Each submission is validated with the same rules as app.py's submit button,
+then compiled to PDF and DOCX in a process pool sized to the cores. A failed
+submission is recorded and the run continues. results.csv in the output
+directory lists the status, errors and per-stage timings of every submission.
+
+Image paths in the manifest become FileImage objects, which are pickled to
+the worker unread; the worker reads each file once and every stage shares
+those bytes.
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+import time
+
+from bulk_export import report_basename
+from manifest import ROW_ERROR, load_manifest
+
+REPORT_FIELDS = ("index", "name", "status", "errors",
+                 "validate_s", "pdf_s", "docx_s", "total_s", "pdf", "docx")
+
+
+def process(index: int, data: dict, out_dir: str, pdf: bool = True, docx: bool = True) -> dict:
+    """Validate and generate one submission (runs in a worker process)."""
+    from docx_generator import generate_docx
+    from latex_generator import generate_pdf
+    from validation import validate
+
+    base = f"{index:04d}_{report_basename(data)}"
+    row = {"index": index, "name": data.get("student_name", ""), "status": "ok", "errors": ""}
+    start = time.perf_counter()
+    if data.get(ROW_ERROR):
+        row.update(status="error", errors=data[ROW_ERROR], total_s=0.0)
+        return row
+    try:
+        errors = validate(data)
+        row["validate_s"] = round(time.perf_counter() - start, 4)
+        if errors:
+            row.update(status="invalid", errors=" | ".join(e.replace("**", "") for e in errors))
+            return row
+
+        if pdf:
+            t = time.perf_counter()
+            payload = generate_pdf(data).getvalue()
+            path = os.path.join(out_dir, base + ".pdf")
+            with open(path, "wb") as f:
+                f.write(payload)
+            row.update(pdf_s=round(time.perf_counter() - t, 4), pdf=path)
+        if docx:
+            t = time.perf_counter()
+            payload = generate_docx(data).getvalue()
+            path = os.path.join(out_dir, base + ".docx")
+            with open(path, "wb") as f:
+                f.write(payload)
+            row.update(docx_s=round(time.perf_counter() - t, 4), docx=path)
+    except Exception as exc:
+        row.update(status="error", errors=f"{type(exc).__name__}: {exc}")
+    finally:
+        row["total_s"] = round(time.perf_counter() - start, 4)
+    return row
+
+
+def run(submissions, out_dir: str, workers: int, pdf: bool = True, docx: bool = True):
+    """
+    Process submissions through a pool, yielding result rows as they finish.
+    At most 2 × workers submissions are in flight, so a large manifest is
+    never loaded into memory at once.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if pdf:
+        from latex_generator import build_format
+        build_format()   # Dump the preamble format once, before workers fork
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for index, data in enumerate(submissions, 1):
+            pending.add(pool.submit(process, index, data, out_dir, pdf, docx))
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validate and generate reports for a manifest.")
+    parser.add_argument("manifest", help="JSONL, CSV or submission store (.db) manifest")
+    parser.add_argument("-o", "--output-dir", required=True, help="Directory for reports and results.csv")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 2,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--no-pdf", action="store_true", help="Skip PDF generation")
+    parser.add_argument("--no-docx", action="store_true", help="Skip DOCX generation")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts = {"ok": 0, "invalid": 0, "error": 0}
+    rows = []
+    for row in run(load_manifest(args.manifest), args.output_dir, max(1, args.jobs),
+                   pdf=not args.no_pdf, docx=not args.no_docx):
+        counts[row["status"]] += 1
+        rows.append(row)
+        if row["status"] != "ok":
+            print(f"{row['index']:4d} {row['name']}: {row['status']} — {row['errors']}", file=sys.stderr)
+
+    rows.sort(key=lambda r: r["index"])
+    report = os.path.join(args.output_dir, "results.csv")
+    with open(report, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(rows)} submissions in {elapsed:.1f}s: {counts['ok']} ok, "
+          f"{counts['invalid']} invalid, {counts['error']} failed. Report: {report}")
+    return 0 if counts["ok"] == len(rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
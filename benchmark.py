@@ -0,0 +1,412 @@
+"""
+benchmark.py — Timing and memory benchmarks for the generation pipeline.
+
+    python benchmark.py -n 12 -r 3 --concurrency 8 -o bench.json
+    python benchmark.py -o new.json --compare bench.json   # flag regressions
+
+Synthetic submissions cover the three layouts, word counts up to the
+config.py limits, varying math density and images up to MAX_IMAGE_SIZE_MB.
+Each pipeline stage is timed separately: "cold" passes start with every
+in-process cache cleared, "warm" passes repeat the same inputs immediately.
+Memory is measured in separate passes, so it does not skew timings:
+rss_kb is the peak resident-set growth of a cold pass run in a fresh
+process (it includes Pillow's C buffers), child_rss_kb the sampled peak of
+that pass's child processes (pdflatex), and py_heap_kb the Python heap
+peak from tracemalloc. The RSS figures need Linux /proc.
+The artifact cache is disabled throughout.
+
+The concurrent scenario runs N simulated submitters at once (validation,
+PDF and DOCX, like the submit button) and reports latency percentiles and
+throughput. Results are written as JSON; --compare flags stages whose
+time or memory grew by more than --threshold.
+"""
+
+import argparse
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from PIL import Image
+
+import config as C
+import image_pipeline
+import math_cache
+import text_segments
+from docx_generator import _prep_image, generate_docx
+from latex_generator import (
+    LAYOUT_FIGURES, LAYOUT_TEXT_ONLY, LAYOUT_TWO_PARAGRAPHS,
+    _generate_latex_source, _image_files, escape_latex, generate_latex_zip, generate_pdf,
+)
+from validation import FIGURES_MAX_WORDS, validate
+
+_WORDS = ("soil moisture stiffness cyclic loading sensor network bridge deck corrosion "
+          "hydraulic model calibration uncertainty groundwater flow settlement pavement "
+          "concrete fatigue seismic response traffic dataset reliability").split()
+_MATH = (r"x^2", r"\alpha_i", r"\frac{a}{b}", r"\sum_{i=1}^{n} x_i", r"E = mc^2",
+         r"\sqrt{k_s}", r"\sigma'_v", r"\int_0^L q(x)\,dx")
+
+
+class _Upload(io.BytesIO):
+    """In-memory stand-in for Streamlit's UploadedFile."""
+
+    def __init__(self, payload: bytes, name: str):
+        super().__init__(payload)
+        self.name = name
+        self.size = len(payload)
+
+
+# ── Synthetic submissions ───────────────────────────────────────────────────
+
+def _text(rng, words: int, math_density: float) -> str:
+    out = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < math_density * 0.1:
+            out.append(f"$${rng.choice(_MATH)}$$")
+        elif roll < math_density:
+            out.append(f"${rng.choice(_MATH)}$")
+        else:
+            out.append(rng.choice(_WORDS))
+    return " ".join(out)
+
+
+_quality_memo = {}   # (kind, max_bytes) -> JPEG quality that fits
+
+
+def _image(rng, kind: str, max_bytes: int) -> _Upload:
+    """
+    A noisy JPEG/PNG (noise defeats compression, so sizes are realistic).
+    Every call draws new noise: identical bytes would be derivative-cache
+    hits and make the cold passes look faster than they are.
+    """
+    sizes = {"small": (800, 600), "medium": (2400, 1800), "large": (4000, 3000)}
+    fmt = "PNG" if kind == "medium" and rng.random() < 0.5 else "JPEG"
+    w, h = sizes[kind]
+    noise = random.Random(rng.getrandbits(64)).randbytes(w * h * 3)
+    img = Image.frombytes("RGB", (w, h), noise)
+    quality = _quality_memo.get((kind, max_bytes), 95)
+    while True:
+        buf = io.BytesIO()
+        if fmt == "PNG":
+            img.save(buf, format="PNG")
+        else:
+            img.save(buf, format="JPEG", quality=quality)
+        if buf.tell() <= max_bytes or quality <= 20:
+            break
+        if fmt == "PNG":
+            fmt = "JPEG"   # Noise PNGs can exceed the limit; fall back
+            continue
+        quality -= 10
+    if fmt == "JPEG":
+        _quality_memo[(kind, max_bytes)] = quality
+    return _Upload(buf.getvalue(), f"{kind}.{'png' if fmt == 'PNG' else 'jpg'}")
+
+
+def synthetic_submissions(n: int, seed: int = 0, max_image_mb: float = None):
+    """n submissions cycling through the layouts with varied text, math and images."""
+    rng = random.Random(seed)
+    max_bytes = int((max_image_mb or C.MAX_IMAGE_SIZE_MB) * 1024 * 1024)
+    layouts = (LAYOUT_TEXT_ONLY, LAYOUT_TWO_PARAGRAPHS, LAYOUT_FIGURES)
+    image_kinds = ("small", "medium", "large")
+    out = []
+    for i in range(n):
+        layout = layouts[i % 3]
+        density = (0.0, 0.05, 0.2)[(i // 3) % 3]
+        data = {
+            "layout": layout,
+            "student_name": f"Student {i} Example",
+            "graduate_program": "Civil Engineering",
+            "research_topic": _text(rng, rng.randint(5, C.RESEARCH_TOPIC_MAX_WORDS // 2), density),
+            "sponsor": "NSF" if i % 2 else "",
+            "degree": "PhD", "year": "2026",
+            "contact_email": f"student{i}@unr.edu",
+            "advisor": "Dr. Advisor", "career_goal": "Academia",
+            "headshot": _image(rng, image_kinds[i % 3], max_bytes),
+            "abstract_p2": "", "figure_1": None, "caption_1": "", "figure_2": None, "caption_2": "",
+        }
+        if layout == LAYOUT_TWO_PARAGRAPHS:
+            p1 = rng.randint(50, C.ABSTRACT_MAX_WORDS_P1)
+            data["abstract_p1"] = _text(rng, p1, density)
+            data["abstract_p2"] = _text(rng, rng.randint(20, C.ABSTRACT_MAX_WORDS_TOTAL - p1), density)
+        elif layout == LAYOUT_FIGURES:
+            data["abstract_p1"] = _text(rng, rng.randint(50, FIGURES_MAX_WORDS), density)
+            data["figure_1"] = _image(rng, image_kinds[(i + 1) % 3], max_bytes)
+            data["caption_1"] = _text(rng, rng.randint(5, C.CAPTION_MAX_WORDS), density)
+            if i % 2:
+                data["figure_2"] = _image(rng, image_kinds[(i + 2) % 3], max_bytes)
+                data["caption_2"] = _text(rng, rng.randint(5, C.CAPTION_MAX_WORDS), density)
+        else:
+            data["abstract_p1"] = _text(rng, rng.randint(50, C.ABSTRACT_MAX_WORDS_TOTAL), density)
+        out.append(data)
+    return out
+
+
+# ── Stage timings ───────────────────────────────────────────────────────────
+
+def _clear_caches() -> None:
+    """Reset every in-process cache so a pass starts cold."""
+    text_segments.parse.cache_clear()
+    text_segments.to_latex.cache_clear()
+    text_segments.to_html.cache_clear()
+    text_segments.math_to_html.cache_clear()
+    math_cache.clear()
+    with image_pipeline._cache_lock:
+        image_pipeline._cache.clear()
+        image_pipeline._thumbs.clear()
+
+
+def _pass(fn, calls):
+    """Run every call once; returns (seconds per call, failed calls)."""
+    failed = 0
+    start = time.perf_counter()
+    for args in calls:
+        try:
+            fn(*args)
+        except Exception:
+            failed += 1   # e.g. a synthetic page overflow; timing still counts
+    return (time.perf_counter() - start) / max(len(calls), 1), failed
+
+
+def _proc_kb(path: str, field: str):
+    """A 'Field:  N kB' line from a /proc status file (Linux only; None elsewhere)."""
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _children_rss_kb() -> int:
+    """Total RSS of this process's live children (pdflatex while it runs)."""
+    total = 0
+    for task in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{task}/children") as f:
+                pids = f.read().split()
+        except OSError:
+            continue
+        total += sum(_proc_kb(f"/proc/{pid}/status", "VmRSS") or 0 for pid in pids)
+    return total
+
+
+def _rss_pass(fn, calls):
+    """
+    One cold pass in a fresh process (run via a spawned pool), so allocator
+    and Pillow block caches left by earlier passes cannot hide the peak.
+    Returns (peak RSS growth KB, peak RSS of child processes KB); either is
+    None where /proc is unavailable.
+
+    The peak comes from VmHWM after resetting it: ru_maxrss would include
+    RSS inherited from the parent across fork/exec.
+    """
+    C.ARTIFACT_CACHE_ENABLED = False
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")   # Reset VmHWM to the current RSS
+    except OSError:
+        _pass(fn, calls)
+        return None, None
+    base = _proc_kb("/proc/self/status", "VmRSS")
+
+    children, done = [0], threading.Event()
+
+    def sample():
+        while not done.wait(0.01):
+            children[0] = max(children[0], _children_rss_kb())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        _pass(fn, calls)
+    finally:
+        done.set()
+        sampler.join()
+    peak = _proc_kb("/proc/self/status", "VmHWM")
+    return max(0, peak - base) if peak and base else None, children[0] or None
+
+
+def bench_stage(fn, calls, repeat: int) -> dict:
+    cold, warm, failed = [], [], 0
+    for _ in range(repeat):
+        _clear_caches()
+        seconds, failed = _pass(fn, calls)
+        cold.append(seconds)
+        warm.append(_pass(fn, calls)[0])
+
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        rss, child_rss = pool.submit(_rss_pass, fn, calls).result()
+
+    _clear_caches()
+    tracemalloc.start()
+    _pass(fn, calls)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "calls": len(calls),
+        "failed": failed,
+        "cold_ms": round(statistics.median(cold) * 1000, 3),
+        "warm_ms": round(statistics.median(warm) * 1000, 3),
+        "rss_kb": rss,
+        "py_heap_kb": round(peak / 1024, 1),
+        "child_rss_kb": child_rss,
+    }
+
+
+def _stages(submissions):
+    """(name, function, argument tuples) for every benchmarked stage."""
+    images = []
+    for data in submissions:
+        images.append((data["headshot"], image_pipeline.SLOT_HEADSHOT))
+        pair = data.get("figure_1") and data.get("figure_2")
+        slot = image_pipeline.SLOT_FIGURE_PAIR if pair else image_pipeline.SLOT_FIGURE_SINGLE
+        images += [(data[k], slot) for k in ("figure_1", "figure_2") if data.get(k)]
+    stages = [
+        ("escape_latex", escape_latex, [(d["abstract_p1"],) for d in submissions]),
+        # Images derived up front so this stage times template rendering only
+        ("_generate_latex_source", _generate_latex_source,
+         [(d, False, _image_files(d)) for d in submissions]),
+        ("_prep_image", _prep_image, images),
+        ("generate_docx", generate_docx, [(d,) for d in submissions]),
+        ("generate_latex_zip", generate_latex_zip, [(d,) for d in submissions]),
+    ]
+    if shutil.which("pdflatex"):
+        stages.append(("generate_pdf", generate_pdf, [(d,) for d in submissions]))
+    return stages
+
+
+# ── Concurrent load ─────────────────────────────────────────────────────────
+
+def concurrent_load(submissions, submitters: int) -> dict:
+    """N simulated users pressing the submit button at the same moment."""
+    with_pdf = bool(shutil.which("pdflatex"))
+
+    def submit(index):
+        data = submissions[index % len(submissions)]
+        start = time.perf_counter()
+        validate(data)
+        if with_pdf:
+            generate_pdf(data, session_id=f"bench-{index}")
+        generate_docx(data)
+        return time.perf_counter() - start
+
+    _clear_caches()
+    latencies, failed = [], 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=submitters) as pool:
+        for future in [pool.submit(submit, i) for i in range(submitters)]:
+            try:
+                latencies.append(future.result())
+            except Exception:
+                failed += 1
+    wall = time.perf_counter() - start
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+    return {
+        "submitters": submitters,
+        "with_pdf": with_pdf,
+        "failed": failed,
+        "p50_ms": pick(0.5) if latencies else None,
+        "p95_ms": pick(0.95) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+        "throughput_per_s": round(len(latencies) / wall, 2),
+    }
+
+
+# ── Comparison ──────────────────────────────────────────────────────────────
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    """Stages whose cold/warm time or memory grew by more than threshold."""
+    flagged = []
+    for name, now in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before:
+            continue
+        for metric in ("cold_ms", "warm_ms", "rss_kb", "py_heap_kb"):
+            old, new = before.get(metric), now.get(metric)
+            if old and new and new > old * (1 + threshold):
+                flagged.append(f"{name}.{metric}: {old} -> {new} (+{new / old - 1:.0%})")
+    old_c, new_c = previous.get("concurrent") or {}, current.get("concurrent") or {}
+    if old_c.get("submitters") == new_c.get("submitters"):
+        old, new = old_c.get("p95_ms"), new_c.get("p95_ms")
+        if old and new and new > old * (1 + threshold):
+            flagged.append(f"concurrent.p95_ms: {old} -> {new} (+{new / old - 1:.0%})")
+    return flagged
+
+
+def run(n: int, repeat: int, concurrency: int, seed: int = 0, max_image_mb: float = None) -> dict:
+    cache_enabled, C.ARTIFACT_CACHE_ENABLED = C.ARTIFACT_CACHE_ENABLED, False
+    try:
+        submissions = synthetic_submissions(n, seed, max_image_mb)
+        results = {name: bench_stage(fn, calls, repeat) for name, fn, calls in _stages(submissions)}
+        load = concurrent_load(submissions, concurrency) if concurrency else None
+    finally:
+        C.ARTIFACT_CACHE_ENABLED = cache_enabled
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "submissions": n, "repeat": repeat, "seed": seed,
+            "pdflatex": bool(shutil.which("pdflatex")),
+        },
+        "stages": results,
+        "concurrent": load,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the report generation pipeline.")
+    parser.add_argument("-n", "--submissions", type=int, default=12, help="Synthetic submissions")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Passes per stage (median reported)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Simulated simultaneous submitters (0 = skip)")
+    parser.add_argument("--max-image-mb", type=float, default=None,
+                        help=f"Largest synthetic image (default {C.MAX_IMAGE_SIZE_MB} MB)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="Write results JSON here")
+    parser.add_argument("--compare", help="Previous results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed growth before flagging (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    result = run(args.submissions, max(1, args.repeat), args.concurrency, args.seed, args.max_image_mb)
+
+    print(f"{'stage':<24}{'calls':>6}{'cold ms':>10}{'warm ms':>10}{'RSS KB':>10}{'heap KB':>10}")
+    for name, r in result["stages"].items():
+        print(f"{name:<24}{r['calls']:>6}{r['cold_ms']:>10.2f}{r['warm_ms']:>10.2f}"
+              f"{r['rss_kb'] if r['rss_kb'] is not None else '-':>10}{r['py_heap_kb']:>10.0f}")
+    if not result["meta"]["pdflatex"]:
+        print("(pdflatex not found: generate_pdf skipped)")
+    if result["concurrent"]:
+        c = result["concurrent"]
+        print(f"concurrent x{c['submitters']}: p50 {c['p50_ms']} ms, p95 {c['p95_ms']} ms, "
+              f"{c['throughput_per_s']}/s, {c['failed']} failed")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            flagged = compare(json.load(f), result, args.threshold)
+        for line in flagged:
+            print(f"REGRESSION {line}")
+        return 1 if flagged else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
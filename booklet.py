@@ -0,0 +1,146 @@
+"""
+booklet.py — Merge every submission into one proceedings booklet PDF.
+
+    python booklet.py submissions.jsonl -o booklet.pdf [--title "..."]
+
+All submissions are rendered from the same body template as generate_pdf
+and typeset in a single document: a title and table of contents, then one
+student per page with a PDF bookmark each. The whole booklet costs two
+pdflatex runs (the second picks up the table of contents), so TeX startup
+and font loading are paid once instead of once per student.
+
+Each student's content is fenced by \\clearpage and its page span is logged,
+so a submission that no longer fits on one page is reported by index.
+
+The booklet's images are written to a disk-backed temporary directory, not
+the RAM-backed work directory pool: a whole event's derivatives can exceed
+a container's /dev/shm.
+
+The booklet compile itself is untested: it has not yet been run against a
+TeX installation, so check the first real build page by page.
+"""
+
+import argparse
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import NamedTuple
+
+import config as C
+import latex_format
+from compile_pool import scheduler
+from latex_generator import (
+    LATEX_PREAMBLE, _generate_latex_source, _image_files, _run_pdflatex,
+    _save_image_to_disk, _write_source, escape_latex,
+)
+from manifest import ROW_ERROR, load_manifest
+
+# Loaded after the shared preamble (or its precompiled format)
+BOOKLET_SETUP = r"""\usepackage[hidelinks, bookmarksopen]{hyperref}
+\newcounter{gsastart}
+\newcommand{\gsabegin}[1]{\clearpage\phantomsection\addcontentsline{toc}{section}{#1}\setcounter{gsastart}{\value{page}}\setcounter{figure}{0}}
+\newcommand{\gsaend}[1]{\clearpage\typeout{GSA-STUDENT:#1:\the\numexpr\value{page}-\value{gsastart}\relax}}
+"""
+
+_STUDENT_PAGES_RE = re.compile(r"GSA-STUDENT:(\d+):(\d+)")
+
+
+class BookletEntry(NamedTuple):
+    index: int          # 1-based position in the manifest
+    name: str
+    pages: int          # Pages the student's content spans (None if unknown)
+    error: str = None   # Set for a manifest row that could not be read (skipped)
+
+
+def _student_body(index: int, data: dict, work_dir: str) -> str:
+    """Write one student's images with unique names and return their content."""
+    images = {key: (f"s{index:04d}_{filename}", payload)
+              for key, (filename, payload) in _image_files(data).items()}
+    for filename, payload in images.values():
+        _save_image_to_disk(payload, os.path.join(work_dir, filename))
+    body = _generate_latex_source(data, body_only=True, images=images)
+    # Keep what is between \begin{document} and \end{document}
+    content = body.partition(r"\begin{document}")[2].rpartition(r"\end{document}")[0]
+    entry = escape_latex(data.get("student_name", ""))
+    program = escape_latex(data.get("graduate_program", ""))
+    if program:
+        entry += f" ({program})"
+    return f"\\gsabegin{{{entry}}}\n{content}\n\\gsaend{{{index}}}\n"
+
+
+def build_booklet(submissions, title: str = "Graduate Student Symposium"):
+    """
+    Typeset every submission into one PDF; unreadable manifest rows are
+    skipped. Returns (pdf BytesIO, [BookletEntry, ...]) in submission order.
+    """
+    work_dir = tempfile.mkdtemp(prefix="gsa_booklet_")
+    try:
+        rows = []   # (name, manifest error)
+        with open(os.path.join(work_dir, "students.tex"), "w", encoding="utf-8") as f:
+            for index, data in enumerate(submissions, 1):
+                if data.get(ROW_ERROR):
+                    rows.append(("", data[ROW_ERROR]))
+                    continue
+                f.write(_student_body(index, data, work_dir))
+                rows.append((data.get("student_name", ""), None))
+
+        body = (
+            BOOKLET_SETUP
+            + "\\begin{document}\n\\pagenumbering{roman}\n"
+            + f"\\begin{{center}}{{\\LARGE\\textbf{{{escape_latex(title)}}}}}\\end{{center}}\n"
+            + "\\tableofcontents\n\\clearpage\n\\pagenumbering{arabic}\n"
+            + "\\input{students.tex}\n\\end{document}\n"
+        )
+
+        with scheduler.slot():
+            fmt = latex_format.current_format(LATEX_PREAMBLE)
+            log = ""
+            for use_fmt in ((fmt, None) if fmt else (None,)):
+                _write_source(work_dir, body, use_fmt)
+                # Pass 1 writes the .toc; pass 2 typesets it
+                for _ in range(2):
+                    log = _run_pdflatex(work_dir, fmt=use_fmt, timeout=C.BOOKLET_TIMEOUT_S)
+                if os.path.exists(os.path.join(work_dir, "main.pdf")):
+                    break
+
+        pdf_path = os.path.join(work_dir, "main.pdf")
+        if not os.path.exists(pdf_path):
+            raise RuntimeError(f"Booklet failed to generate. LaTeX Log: {log}")
+        with open(pdf_path, "rb") as f:
+            pdf = io.BytesIO(f.read())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    pages = {int(i): int(n) for i, n in _STUDENT_PAGES_RE.findall(log)}
+    entries = [BookletEntry(i, name, pages.get(i), error)
+               for i, (name, error) in enumerate(rows, 1)]
+    return pdf, entries
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build the proceedings booklet from a manifest.")
+    parser.add_argument("manifest", help="JSONL, CSV or submission store (.db) manifest")
+    parser.add_argument("-o", "--output", required=True, help="Output PDF path")
+    parser.add_argument("--title", default="Graduate Student Symposium", help="Booklet title")
+    args = parser.parse_args(argv)
+
+    pdf, entries = build_booklet(load_manifest(args.manifest), title=args.title)
+    with open(args.output, "wb") as f:
+        f.write(pdf.getvalue())
+
+    skipped = [e for e in entries if e.error]
+    over = [e for e in entries if not e.error and (e.pages is None or e.pages > 1)]
+    for e in skipped:
+        print(f"{e.index:4d} skipped: {e.error}", file=sys.stderr)
+    for e in over:
+        print(f"{e.index:4d} {e.name}: {e.pages or '?'} pages", file=sys.stderr)
+    print(f"{len(entries)} submissions -> {args.output} "
+          f"({len(over)} over one page, {len(skipped)} skipped)")
+    return 1 if over or skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
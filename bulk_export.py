@@ -0,0 +1,140 @@
+"""
+bulk_export.py — Streaming archive of every submission for the organisers'
+end-of-event export.
+
+stream_archive() is a generator of ZIP bytes: each submission's main.tex,
+images, PDF and DOCX are generated, written and flushed before the next one
+is loaded, so memory stays flat whatever the number of submissions. Already
+compressed media (PNG, JPEG, PDF, DOCX) is stored rather than deflated.
+
+Use the generator as a streaming HTTP response body, or from the CLI:
+    python bulk_export.py manifest.jsonl -o symposium_export.zip
+"""
+
+import argparse
+import sys
+import time
+import zipfile
+
+import latex_generator
+from docx_generator import generate_docx
+from manifest import ROW_ERROR, load_manifest
+
+# Extensions whose payloads are already compressed
+_STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".pdf", ".docx", ".zip")
+
+
+class _ChunkSink:
+    """Write-only file object that collects ZIP output until it is drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def report_basename(data: dict) -> str:
+    """File name stem used for a student's downloads (same scheme as app.py)."""
+    parts = (data.get("student_name") or "").strip().split()
+    last = parts[-1] if parts else "Unknown"
+    first = parts[0] if len(parts) > 1 else ""
+    prog = (data.get("graduate_program") or "").strip().replace(" ", "")
+    return f"GS26_{last}_{first}_{prog}"
+
+
+def _failure(stage: str, exc: Exception) -> str:
+    return f"{stage} failed: {type(exc).__name__}: {exc}"
+
+
+def _entries(data: dict):
+    """Yield (filename, payload) for one submission; failures go to ERROR.txt."""
+    if data.get(ROW_ERROR):
+        yield "ERROR.txt", f"Manifest row unreadable: {data[ROW_ERROR]}\n".encode("utf-8")
+        return
+    base = report_basename(data)
+    errors = []
+    try:
+        tex_content, images = latex_generator.latex_bundle(data)
+    except Exception as exc:
+        errors.append(_failure("LaTeX bundle", exc))
+    else:
+        yield "main.tex", tex_content.encode("utf-8")
+        yield from images
+
+    try:
+        yield f"{base}.pdf", latex_generator.generate_pdf(data).getvalue()
+    except Exception as exc:
+        errors.append(_failure("PDF generation", exc))
+    try:
+        yield f"{base}.docx", generate_docx(data).getvalue()
+    except Exception as exc:
+        errors.append(_failure("DOCX generation", exc))
+    if errors:
+        yield "ERROR.txt", ("\n".join(errors) + "\n").encode("utf-8")
+
+
+def _write(archive, sink, name, payload, stamp):
+    info = zipfile.ZipInfo(name, date_time=stamp)
+    if name.lower().endswith(_STORED_EXTENSIONS):
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    archive.writestr(info, payload)
+    return sink.drain()
+
+
+def stream_archive(submissions):
+    """
+    Yield the bytes of a ZIP containing one folder per submission. If the
+    manifest itself cannot be read further, the error is recorded and the
+    archive is still closed properly.
+    """
+    sink = _ChunkSink()
+    stamp = time.localtime()[:6]
+    with zipfile.ZipFile(sink, "w") as archive:
+        rows = iter(submissions)
+        index = 0
+        while True:
+            index += 1
+            try:
+                data = next(rows)
+            except StopIteration:
+                break
+            except Exception as exc:
+                yield from _write(archive, sink, f"{index:04d}_manifest/ERROR.txt",
+                                  (_failure("Manifest read", exc) + "\n").encode("utf-8"), stamp)
+                break
+            folder = f"{index:04d}_{report_basename(data)}"
+            for filename, payload in _entries(data):
+                yield from _write(archive, sink, f"{folder}/{filename}", payload, stamp)
+    # Central directory is written on close
+    yield from sink.drain()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export every submission into one ZIP archive.")
+    parser.add_argument("manifest", help="JSONL, CSV or submission store (.db) manifest")
+    parser.add_argument("-o", "--output", default="-", help="Output .zip path ('-' for stdout)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        for chunk in stream_archive(load_manifest(args.manifest)):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
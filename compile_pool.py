@@ -0,0 +1,156 @@
+"""
+compile_pool.py — Process-wide scheduler that bounds concurrent pdflatex runs.
+
+Every Streamlit session runs in its own thread of the same server process.
+Without a cap, a deadline rush starts dozens of pdflatex processes at once and
+everyone's compile slows down. Compiles instead take a slot from this
+scheduler: at most COMPILE_MAX_WORKERS run at once, the rest wait in FIFO
+order and can report their queue position back to the UI.
+"""
+
+import collections
+import contextlib
+import math
+import threading
+import time
+
+import config as C
+
+
+class CompileRateLimited(RuntimeError):
+    """Raised when one session asks for compiles faster than allowed."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Please wait {math.ceil(retry_after)} s before generating again.")
+        self.retry_after = retry_after
+
+
+class CompileBusy(RuntimeError):
+    """Raised for speculative compiles when no spare capacity is available."""
+
+
+class CompileCancelled(RuntimeError):
+    """Raised when a waiting request is cancelled before it gets a slot."""
+
+
+class CompileScheduler:
+    """FIFO compile queue with a worker cap and per-session rate limiting."""
+
+    def __init__(self, max_workers: int, min_interval_s: float = 0.0,
+                 max_speculative: int = 1, reserved_workers: int = 1):
+        self.max_workers = max(1, max_workers)
+        self.min_interval_s = min_interval_s
+        self.max_speculative = max_speculative
+        self.reserved_workers = reserved_workers
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._active = 0
+        self._speculative = 0
+        self._last_request = {}   # session_id -> monotonic time of last request
+        self._in_flight = set()   # session_ids queued or compiling
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"active": self._active, "queued": len(self._queue),
+                    "speculative": self._speculative, "max_workers": self.max_workers}
+
+    def _admit(self, session_id) -> None:
+        """Apply per-session limits. Caller holds the lock."""
+        if session_id is None:
+            return
+        now = time.monotonic()
+        if session_id in self._in_flight:
+            raise CompileRateLimited(self.min_interval_s)
+        last = self._last_request.get(session_id)
+        if last is not None and now - last < self.min_interval_s:
+            raise CompileRateLimited(self.min_interval_s - (now - last))
+        self._last_request[session_id] = now
+        self._in_flight.add(session_id)
+
+        # Forget sessions that have been quiet for a while
+        if len(self._last_request) > 1000:
+            cutoff = now - max(self.min_interval_s, 60.0)
+            for sid, t in list(self._last_request.items()):
+                if t < cutoff and sid not in self._in_flight:
+                    del self._last_request[sid]
+
+    @contextlib.contextmanager
+    def speculative_slot(self, cancel=None):
+        """
+        Take a slot only if it cannot delay a real submit: nobody is queued,
+        reserved_workers stay free and the speculative cap is not reached.
+        Never waits; raises CompileBusy instead, or CompileCancelled if the
+        cancel event is already set.
+        """
+        if cancel is not None and cancel.is_set():
+            raise CompileCancelled()
+        with self._cond:
+            spare = self.max_workers - self._active - self.reserved_workers
+            if self._queue or spare < 1 or self._speculative >= self.max_speculative:
+                raise CompileBusy("No spare compile capacity.")
+            self._active += 1
+            self._speculative += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._speculative -= 1
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, session_id=None, on_queue=None, cancel=None):
+        """
+        Block until a compile slot is free, then hold it for the with-block.
+
+        on_queue(position) is called from the waiting thread whenever its
+        1-based position in line changes; it is never called with the lock held.
+        Setting the cancel event (a threading.Event) makes a waiting request
+        leave the queue at once with CompileCancelled.
+        """
+        ticket = object()
+        with self._cond:
+            self._admit(session_id)
+            self._queue.append(ticket)
+
+        try:
+            reported = None
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise CompileCancelled()
+                with self._cond:
+                    if self._queue[0] is ticket and self._active < self.max_workers:
+                        self._queue.popleft()
+                        self._active += 1
+                        self._cond.notify_all()
+                        break
+                    position = self._queue.index(ticket) + 1
+                    if position == reported or on_queue is None:
+                        self._cond.wait(timeout=1.0)
+                        continue
+                reported = position
+                on_queue(position)
+        except BaseException:
+            with self._cond:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._in_flight.discard(session_id)
+                self._cond.notify_all()
+            raise
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._in_flight.discard(session_id)
+                self._cond.notify_all()
+
+
+# Shared by every session in this server process
+scheduler = CompileScheduler(
+    C.COMPILE_MAX_WORKERS,
+    C.COMPILE_MIN_INTERVAL_S,
+    max_speculative=C.SPECULATIVE_MAX_CONCURRENT,
+    reserved_workers=C.SPECULATIVE_RESERVED_WORKERS,
+)
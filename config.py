@@ -4,6 +4,9 @@ config.py — Single-source formatting configuration for GSA Symposium submissio
 Change values here to update ALL generated reports without touching other files.
 """
 
+import os
+import tempfile
+
 from docx.shared import Inches, Pt
 
 # ─── Font & Text ────────────────────────────────────────────────────────────
@@ -18,6 +21,7 @@ FONT_COLOR_HEX = "000000"        # Black
 SPACING_AFTER = Pt(6)            # 6 pt after each paragraph
 SPACING_BEFORE_SECTION = Pt(30)  # Space before Abstract / Figures sections
 LINE_SPACING = 1.0               # Single spacing
+TABLE_CELL_MARGIN_H = Inches(0.075)  # Left/right padding in layout tables (Word default)
 
 # ─── Page Layout ─────────────────────────────────────────────────────────────
 PAGE_MARGIN = Inches(1.0)        # All four margins
@@ -39,6 +43,73 @@ CAPTION_MAX_WORDS = 50
 MAX_IMAGE_SIZE_MB = 10
 MAX_IMAGE_SIZE_BYTES = MAX_IMAGE_SIZE_MB * 1024 * 1024
 ALLOWED_IMAGE_TYPES = ["jpg", "jpeg", "png"]
+MAX_IMAGE_PIXELS = 40_000_000    # Reject larger images before decoding (~160 MB as RGBA)
+MAX_IMAGE_ASPECT = 10.0          # Longest side / shortest side
+
+# ─── Image Derivatives ──────────────────────────────────────────────────────
+IMAGE_DERIVATIVE_DPI = 300       # Max resolution at the printed size
+IMAGE_JPEG_QUALITY = 90          # Re-encode quality for downscaled JPEGs
+IMAGE_CACHE_MAX_ITEMS = 64       # Derivatives kept in memory per process
+THUMBNAIL_MAX_PX = 160           # Longest side of preview thumbnails
+THUMBNAIL_CACHE_ITEMS = 256      # Preview thumbnails (a few KB each) kept per process
+SEGMENT_CACHE_ITEMS = 1024       # Parsed/rendered text fields kept per process
+MATH_CACHE_MAX_ITEMS = 2048      # Converted OMML formulas (and failures) kept per process
+
+# ─── LaTeX Compilation ──────────────────────────────────────────────────────
+LATEX_MAX_PASSES = 3             # Draft pass + output pass + at most one rerun
+LATEX_FORMAT_ENABLED = True      # Compile against a precompiled preamble format
+COMPILE_MAX_WORKERS = os.cpu_count() or 2  # Concurrent pdflatex runs per process
+COMPILE_MIN_INTERVAL_S = 5       # Min seconds between compiles from one session
+LATEX_TIMEOUT_S = 30             # Wall-clock limit per pdflatex run
+LATEX_CPU_LIMIT_S = 30           # CPU-time rlimit per pdflatex run (0 = none)
+LATEX_MEMORY_LIMIT_MB = 1024     # Address-space rlimit per pdflatex run (0 = none)
+BOOKLET_TIMEOUT_S = 900          # Wall-clock and CPU limit per booklet pdflatex pass
+PAGE_ESTIMATE_MARGIN = 0.10      # Estimates within ±10% of a full page need pdflatex
+PAGE_ESTIMATE_REJECT = False     # Reject clear overflows without compiling; enable only once
+                                 # `page_estimator.py --calibrate` passes on this TeX install
+PAGE_COUNT_MEMO_ITEMS = 256      # Draft-pass page counts remembered per process
+SHRINK_MIN_SCALE = 0.5           # Shrink-to-fit never goes below 50% figure height
+SHRINK_STEP = 0.05               # Shrink-to-fit search granularity
+
+# ─── Speculative Compilation ────────────────────────────────────────────────
+SPECULATIVE_ENABLED = True       # Pre-compile valid drafts while the user pauses
+SPECULATIVE_IDLE_S = 3           # Input must be unchanged this long first
+SPECULATIVE_MAX_CONCURRENT = max(1, COMPILE_MAX_WORKERS // 4)
+SPECULATIVE_RESERVED_WORKERS = 1 # Workers always left free for real submits
+
+# ─── Background Jobs ────────────────────────────────────────────────────────
+JOB_MAX_WORKERS = COMPILE_MAX_WORKERS  # Threads running report generation jobs
+JOB_ABANDON_S = 120              # Cancel unfinished jobs nobody has polled this long
+JOB_RESULT_TTL_S = 900           # Drop finished results not fetched this long
 
 # ─── Email ───────────────────────────────────────────────────────────────────
 ADMIN_EMAIL = "skatuwal@unr.edu"
+
+# ─── Submission Store ───────────────────────────────────────────────────────
+# Persistent record of every generated submission (SQLite + blob directory)
+STORE_ENABLED = True
+STORE_DIR = os.environ.get(
+    "GSA_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "submissions")
+)
+STORE_DB_PATH = os.path.join(STORE_DIR, "submissions.db")
+STORE_BLOB_DIR = os.path.join(STORE_DIR, "blobs")   # Images and artifacts by SHA-256
+STORE_COMMIT_BATCH = 50          # Rows per transaction at most
+STORE_COMMIT_INTERVAL_S = 1.0    # Max delay before queued rows are committed
+
+# ─── Caching ─────────────────────────────────────────────────────────────────
+# Root for every on-disk cache; override with GSA_CACHE_DIR so several
+# Streamlit processes on one host share the same artifacts.
+CACHE_ROOT = os.environ.get(
+    "GSA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gsa_symposium_cache")
+)
+ARTIFACT_CACHE_ENABLED = True
+ARTIFACT_CACHE_DIR = os.path.join(CACHE_ROOT, "artifacts")
+ARTIFACT_CACHE_MAX_MB = 512          # Evict oldest artifacts beyond this size
+ARTIFACT_CACHE_MAX_AGE_HOURS = 72    # Evict artifacts not read for this long
+ARTIFACT_CACHE_EVICT_INTERVAL_S = 60 # Min seconds between eviction sweeps
+LATEX_FORMAT_DIR = os.path.join(CACHE_ROOT, "formats")
+JINJA_BYTECODE_CACHE_DIR = os.path.join(CACHE_ROOT, "jinja")
+
+# ─── Compile Work Directories ───────────────────────────────────────────────
+WORKDIR_ROOT = os.environ.get("GSA_WORKDIR_ROOT", "")  # "" = /dev/shm if available
+WORKDIR_POOL_SIZE = 2 * COMPILE_MAX_WORKERS            # Pooled dirs; extra use mkdtemp
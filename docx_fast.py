@@ -0,0 +1,455 @@
+"""
+docx_fast.py — Direct OOXML writer for high-volume DOCX regeneration.
+
+generate_docx builds each report through python-docx's object model, which
+dominates batch runs (e.g. regenerating every submission after a font or
+spacing change in config.py). This backend reuses the pre-styled base package
+from docx_generator, writes word/document.xml as a string from fixed XML
+fragments, and streams the package straight to a file.
+
+generate_docx stays the reference implementation: `python docx_fast.py
+--parity manifest.jsonl` compares the body structure of both outputs and
+`--bench` times them.
+"""
+
+import functools
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+from docx.shared import Emu, Inches, Pt
+from lxml import etree
+
+import config as C
+import image_pipeline
+import math_cache
+import text_segments
+from docx_generator import (
+    STYLE_BODY, STYLE_CAPTION, STYLE_HEADING, STYLE_LABEL, STYLE_NAME, TABLE_STYLE,
+    _base_docx,
+)
+
+_DOCUMENT = "word/document.xml"
+_DOCUMENT_RELS = "word/_rels/document.xml.rels"
+_CONTENT_TYPES = "[Content_Types].xml"
+_IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+_MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png"}
+
+# Characters lxml (and so python-docx) refuses in text nodes
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Run text splits into <w:t>, <w:br/> and <w:tab/> the way python-docx does
+_RUN_SPLIT_RE = re.compile(r"(\t|\r\n|\n|\r)")
+
+
+def _style_id(name: str) -> str:
+    return name.replace(" ", "")
+
+
+# ── Base package skeleton (parsed once) ─────────────────────────────────────
+
+class _Skeleton:
+    """Parts of the base package that every report shares."""
+
+    def __init__(self, package: bytes):
+        with zipfile.ZipFile(io.BytesIO(package)) as z:
+            self.parts = {name: z.read(name) for name in z.namelist()
+                          if name not in (_DOCUMENT, _DOCUMENT_RELS, _CONTENT_TYPES)}
+            document = z.read(_DOCUMENT).decode("utf-8")
+            rels = z.read(_DOCUMENT_RELS).decode("utf-8")
+            types = z.read(_CONTENT_TYPES).decode("utf-8")
+
+        body_start = document.index("<w:body>") + len("<w:body>")
+        body_end = document.rindex("</w:body>")
+        self.document_head = document[:body_start]
+        self.sect_pr = document[body_start:body_end]
+        self.document_tail = document[body_end:]
+
+        self.rels_head, self.rels_tail = rels.rsplit("</Relationships>", 1)
+        self.rels_tail = "</Relationships>" + self.rels_tail
+        used = [int(n) for n in re.findall(r'Id="rId(\d+)"', rels)]
+        self.next_rid = max(used, default=0) + 1
+
+        # The default template only declares .jpeg; media parts use .jpg/.png
+        for ext, mime in _MEDIA_TYPES.items():
+            if f'Extension="{ext}"' not in types:
+                types = types.replace(
+                    "<Default ", f'<Default Extension="{ext}" ContentType="{mime}"/><Default ', 1)
+        self.content_types = types.encode("utf-8")
+
+
+@functools.lru_cache(maxsize=1)
+def _skeleton() -> _Skeleton:
+    return _Skeleton(_base_docx())
+
+
+# ── XML fragments ───────────────────────────────────────────────────────────
+
+def _twips(length) -> int:
+    return int(Emu(length).twips)
+
+
+def _ppr(style=None, align=None, before=None, after=None, line=False) -> str:
+    parts = []
+    if style:
+        parts.append(f'<w:pStyle w:val="{_style_id(style)}"/>')
+    if before is not None or after is not None or line:
+        spacing = ""
+        if before is not None:
+            spacing += f' w:before="{_twips(before)}"'
+        if after is not None:
+            spacing += f' w:after="{_twips(after)}"'
+        if line:
+            spacing += f' w:line="{int(round(C.LINE_SPACING * 240))}" w:lineRule="auto"'
+        parts.append(f"<w:spacing{spacing}/>")
+    if align:
+        parts.append(f'<w:jc w:val="{align}"/>')
+    return f"<w:pPr>{''.join(parts)}</w:pPr>" if parts else ""
+
+
+def _run(text: str, style=None, italic=False, trailing_break=False) -> str:
+    """One <w:r>; tabs and newlines become <w:tab/> and <w:br/>."""
+    if _XML_INVALID_RE.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, "
+                         "no NULL bytes or control characters")
+    rpr = ""
+    if style or italic:
+        rpr = "<w:rPr>"
+        if style:
+            rpr += f'<w:rStyle w:val="{_style_id(style)}"/>'
+        if italic:
+            rpr += "<w:i/>"
+        rpr += "</w:rPr>"
+    content = []
+    for piece in _RUN_SPLIT_RE.split(text):
+        if not piece:
+            continue
+        if piece == "\t":
+            content.append("<w:tab/>")
+        elif piece in ("\n", "\r", "\r\n"):
+            content.append("<w:br/>")
+        else:
+            space = ' xml:space="preserve"' if piece != piece.strip() else ""
+            content.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    if trailing_break:
+        content.append("<w:br/>")
+    return f"<w:r>{rpr}{''.join(content)}</w:r>"
+
+
+def _parsed_runs(text: str) -> str:
+    """Same segmentation as docx_generator._add_parsed_text."""
+    out = []
+    for kind, value in text_segments.parse(text or ""):
+        if kind != text_segments.TEXT:
+            element = math_cache.omml(value)
+            if element is not None:
+                out.append(etree.tostring(element, encoding="unicode"))
+                continue
+            value = text_segments.source(kind, value)
+        out.append(_run(value))
+    return "".join(out)
+
+
+def _paragraph(ppr: str, content: str) -> str:
+    return f"<w:p>{ppr}{content}</w:p>"
+
+
+def _table(grid, cell_width: int, rows) -> str:
+    """Borderless, centered table; rows is a list of lists of cell paragraph XML."""
+    cols = "".join(f'<w:gridCol w:w="{w}"/>' for w in grid)
+    body = "".join(
+        "<w:tr>" + "".join(
+            f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{cell_width}"/></w:tcPr>{cell}</w:tc>'
+            for cell in row) + "</w:tr>"
+        for row in rows)
+    return (
+        f'<w:tbl><w:tblPr><w:tblStyle w:val="{_style_id(TABLE_STYLE)}"/>'
+        f'<w:tblW w:type="auto" w:w="0"/><w:jc w:val="center"/>'
+        f'<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        f'w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>'
+        f"<w:tblGrid>{cols}</w:tblGrid>{body}</w:tbl>"
+    )
+
+
+class _Media:
+    """Image parts and relationships for one report (identical images shared)."""
+
+    def __init__(self, first_rid: int):
+        self.next_rid = first_rid
+        self.parts = []        # (part name, bytes)
+        self.rels = []         # relationship XML
+        self._by_hash = {}
+        self.pictures = 0
+
+    def picture(self, derivative, width_emu: int) -> str:
+        key = image_pipeline.content_hash(derivative.data)
+        rid = self._by_hash.get(key)
+        if rid is None:
+            rid = f"rId{self.next_rid}"
+            self.next_rid += 1
+            target = f"media/image{len(self.parts) + 1}.{derivative.ext}"
+            self.parts.append((f"word/{target}", derivative.data))
+            self.rels.append(f'<Relationship Id="{rid}" Type="{_IMAGE_REL}" Target="{target}"/>')
+            self._by_hash[key] = rid
+        self.pictures += 1
+        cx = int(width_emu)
+        cy = int(round(cx * derivative.height_px / max(derivative.width_px, 1)))
+        name = f"image.{derivative.ext}"
+        return (
+            '<w:r><w:drawing><wp:inline '
+            'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+            'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/>'
+            f'<wp:docPr id="{self.pictures}" name="Picture {self.pictures}"/>'
+            '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="0" name={quoteattr(name)}/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic>'
+            '</wp:inline></w:drawing></w:r>'
+        )
+
+
+# ── Document body (mirrors generate_docx) ───────────────────────────────────
+
+def _body(data: dict, media: _Media) -> str:
+    out = []
+    zero = Pt(0)
+    page_w = _twips(Inches(6.5))   # 8.5" page - 2×1" margins
+
+    # 1. Header — headshot | student information
+    if data.get("headshot"):
+        d = image_pipeline.derive(data["headshot"], image_pipeline.SLOT_HEADSHOT)
+        photo = _paragraph("", media.picture(d, C.HEADSHOT_WIDTH))
+    else:
+        photo = _paragraph("", _run("[No Headshot]", italic=True))
+
+    info_lines = [("Research topic: ", data["research_topic"])]
+    if data.get("sponsor"):
+        info_lines.append(("Sponsor: ", data["sponsor"]))
+    info_lines.extend([
+        ("Degree objective: ", f"{data['degree']} ({data['year']})"),
+        ("Contact: ", data["contact_email"]),
+        ("Advisor: ", data["advisor"]),
+        ("Career goal: ", data["career_goal"]),
+    ])
+    runs = [_run(data["student_name"], STYLE_NAME, trailing_break=True)]
+    for label, value in info_lines:
+        runs.append(_run(label, STYLE_LABEL))
+        runs.append(_run(value, trailing_break=True))
+    info = _paragraph(_ppr(STYLE_BODY, "left", after=zero), "".join(runs))
+
+    headshot_col = _twips(C.HEADSHOT_WIDTH + C.HEADER_GUTTER)
+    out.append(_table((headshot_col, page_w - headshot_col), page_w // 2, [[photo, info]]))
+
+    # 2. Abstract
+    spacer = _paragraph(_ppr(before=C.SPACING_BEFORE_SECTION, after=zero, line=True), "")
+    out.append(spacer)
+    out.append(_paragraph(_ppr(STYLE_HEADING), _run("Abstract")))
+    out.append(_paragraph(_ppr(STYLE_BODY), _parsed_runs(data["abstract_p1"])))
+    two_paragraphs = bool(data.get("abstract_p2", "").strip())
+    if two_paragraphs:
+        out.append(_paragraph(_ppr(STYLE_BODY), _parsed_runs(data["abstract_p2"])))
+
+    # 3. Figures (never alongside a second paragraph)
+    has_fig1 = data.get("figure_1") is not None and not two_paragraphs
+    has_fig2 = data.get("figure_2") is not None and not two_paragraphs
+    scale = data.get("figure_scale") or 1.0
+    if has_fig1 or has_fig2:
+        out.append(spacer)
+        if has_fig1 and has_fig2:
+            images, captions = [], []
+            for n in (1, 2):
+                d = image_pipeline.derive(data[f"figure_{n}"], image_pipeline.SLOT_FIGURE_PAIR)
+                width = int(Inches(d.width_in) * scale)
+                images.append(_paragraph(_ppr(align="center"), media.picture(d, width)))
+                captions.append(_paragraph(
+                    _ppr(STYLE_CAPTION, "left"),
+                    _parsed_runs(f"Figure {n}. ") + _parsed_runs(data.get(f"caption_{n}", ""))))
+            half = page_w // 2
+            out.append(_table((half, half), half, [images, captions]))
+        else:
+            n = 1 if has_fig1 else 2
+            d = image_pipeline.derive(data[f"figure_{n}"], image_pipeline.SLOT_FIGURE_SINGLE)
+            width = int(Inches(d.width_in) * scale)
+            out.append(_paragraph(_ppr(align="center"), media.picture(d, width)))
+            caption = data.get(f"caption_{n}", "")
+            if caption:
+                out.append(_paragraph(_ppr(STYLE_CAPTION, "center"),
+                                      _run(f"Figure {n}. {caption}")))
+    return "".join(out)
+
+
+# ── Package writer ──────────────────────────────────────────────────────────
+
+def write_docx(data: dict, out) -> None:
+    """Stream one report as a .docx package to a path or binary file object."""
+    skel = _skeleton()
+    media = _Media(skel.next_rid)
+    document = skel.document_head + _body(data, media) + skel.sect_pr + skel.document_tail
+    rels = skel.rels_head + "".join(media.rels) + skel.rels_tail
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(_CONTENT_TYPES, skel.content_types)
+        for name, payload in skel.parts.items():
+            z.writestr(name, payload)
+        z.writestr(_DOCUMENT, document.encode("utf-8"))
+        z.writestr(_DOCUMENT_RELS, rels.encode("utf-8"))
+        for name, payload in media.parts:
+            z.writestr(name, payload, compress_type=zipfile.ZIP_STORED)
+
+
+def generate_docx_fast(data: dict) -> io.BytesIO:
+    """Drop-in alternative to docx_generator.generate_docx."""
+    buf = io.BytesIO()
+    write_docx(data, buf)
+    buf.seek(0)
+    return buf
+
+
+# ── Parity and benchmark ────────────────────────────────────────────────────
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_M = "{http://schemas.openxmlformats.org/officeDocument/2006/math}"
+_WP = "{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}"
+
+
+def _paragraph_outline(p) -> tuple:
+    ppr = p.find(f"{_W}pPr")
+    style = align = spacing = None
+    if ppr is not None:
+        el = ppr.find(f"{_W}pStyle")
+        style = el.get(f"{_W}val") if el is not None else None
+        el = ppr.find(f"{_W}jc")
+        align = el.get(f"{_W}val") if el is not None else None
+        el = ppr.find(f"{_W}spacing")
+        spacing = tuple(sorted(el.attrib.items())) if el is not None else None
+    runs = []
+    for child in p:
+        if child.tag == f"{_W}r":
+            rpr = child.find(f"{_W}rPr")
+            fmt = tuple(sorted(etree.QName(e).localname + str(e.get(f"{_W}val"))
+                               for e in rpr)) if rpr is not None else ()
+            text = "".join(t.text or "" for t in child.iter(f"{_W}t"))
+            breaks = len(child.findall(f"{_W}br"))
+            extent = child.find(f".//{_WP}extent")
+            size = (int(extent.get("cx")), int(extent.get("cy"))) if extent is not None else None
+            runs.append(("r", fmt, text, breaks, size))
+        elif child.tag in (f"{_M}oMath", f"{_M}oMathPara"):
+            runs.append(("math", etree.tostring(child, method="c14n")))
+    return ("p", style, align, spacing, tuple(runs))
+
+
+def outline(docx_bytes: bytes) -> list:
+    """Layout-relevant structure of a document body, for parity checks."""
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        root = etree.fromstring(z.read(_DOCUMENT))
+    body = root.find(f"{_W}body")
+    items = []
+    for child in body:
+        if child.tag == f"{_W}p":
+            items.append(_paragraph_outline(child))
+        elif child.tag == f"{_W}tbl":
+            grid = tuple(int(c.get(f"{_W}w")) for c in child.iter(f"{_W}gridCol"))
+            style = child.find(f"{_W}tblPr/{_W}tblStyle").get(f"{_W}val")
+            cells = tuple(tuple(_paragraph_outline(p) for p in tc.iter(f"{_W}p"))
+                          for tc in child.iter(f"{_W}tc"))
+            items.append(("tbl", style, grid, cells))
+        elif child.tag == f"{_W}sectPr":
+            items.append(("sectPr", etree.tostring(child, method="c14n")))
+    return items
+
+
+def _close_extents(a, b) -> bool:
+    """Picture sizes may differ by rounding (python-docx goes through image DPI)."""
+    if isinstance(a, tuple) and isinstance(b, tuple) and a[:1] == b[:1] == ("r",):
+        sa, sb = a[4], b[4]
+        if a[:4] != b[:4]:
+            return False
+        if sa is None or sb is None:
+            return sa == sb
+        return all(abs(x - y) <= 1000 for x, y in zip(sa, sb))   # ~0.001 in
+    if isinstance(a, tuple) and isinstance(b, tuple) and len(a) == len(b):
+        return all(_close_extents(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def parity(data: dict) -> list:
+    """Differences between the reference and fast outputs ([] means equivalent)."""
+    from docx_generator import generate_docx
+
+    ref = outline(generate_docx(data).getvalue())
+    fast = outline(generate_docx_fast(data).getvalue())
+    diffs = []
+    if len(ref) != len(fast):
+        diffs.append(f"body has {len(fast)} blocks, reference has {len(ref)}")
+    for i, (a, b) in enumerate(zip(ref, fast)):
+        if not _close_extents(a, b):
+            diffs.append(f"block {i}: {b!r:.200} != reference {a!r:.200}")
+    return diffs
+
+
+def benchmark(submissions, repeat: int = 3) -> dict:
+    """Best-of-`repeat` wall time for both backends over the same submissions."""
+    import time
+    from docx_generator import generate_docx
+
+    def reference(data):
+        # Bypass the artifact cache so both backends do the full build
+        enabled, C.ARTIFACT_CACHE_ENABLED = C.ARTIFACT_CACHE_ENABLED, False
+        try:
+            generate_docx(data)
+        finally:
+            C.ARTIFACT_CACHE_ENABLED = enabled
+
+    timings = {}
+    for label, fn in (("python-docx", reference), ("fast", generate_docx_fast)):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for data in submissions:
+                fn(data)
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+    timings["speedup"] = timings["python-docx"] / max(timings["fast"], 1e-9)
+    return timings
+
+
+def main(argv=None) -> int:
+    import argparse
+    import os
+    from bulk_export import report_basename
+    from manifest import load_manifest
+
+    parser = argparse.ArgumentParser(description="Regenerate DOCX reports with the fast writer.")
+    parser.add_argument("manifest", help="JSONL, CSV or submission store (.db) manifest")
+    parser.add_argument("-o", "--output-dir", help="Write one .docx per submission here")
+    parser.add_argument("--parity", action="store_true", help="Compare with generate_docx")
+    parser.add_argument("--bench", action="store_true", help="Time both backends")
+    args = parser.parse_args(argv)
+
+    submissions = list(load_manifest(args.manifest))
+    status = 0
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for index, data in enumerate(submissions, 1):
+            name = f"{index:04d}_{report_basename(data)}.docx"
+            write_docx(data, os.path.join(args.output_dir, name))
+    if args.parity:
+        for index, data in enumerate(submissions, 1):
+            diffs = parity(data)
+            status |= bool(diffs)
+            print(f"{index:4d} {report_basename(data)}: {'ok' if not diffs else 'MISMATCH'}")
+            for diff in diffs:
+                print(f"       {diff}")
+    if args.bench:
+        t = benchmark(submissions)
+        print(f"python-docx {t['python-docx']:.3f}s  fast {t['fast']:.3f}s  "
+              f"speedup {t['speedup']:.1f}x  ({len(submissions)} submissions)")
+    return status
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
@@ -3,94 +3,127 @@ docx_generator.py — Generates a formatted .docx report that replicates
 the layout defined in Template.tex (headshot + info block, abstract, figures).
 """
 
+import functools
 import io
-import re
 from docx import Document
-from docx.shared import Inches, Pt, RGBColor
+from docx.shared import Emu, Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.table import WD_TABLE_ALIGNMENT
-from docx.oxml.ns import qn
-from PIL import Image
-
-import math2docx
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+import artifact_cache
+import image_pipeline
+import math_cache
+import text_segments
 import config as C
 
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
 
-def _apply(run, font_size=None, bold=False, italic=False):
-    """Apply consistent font styling to a single run."""
-    run.font.name = C.FONT_NAME
-    run.font.size = font_size or C.FONT_SIZE_BODY
-    run.font.color.rgb = RGBColor.from_string(C.FONT_COLOR_HEX)
-    run.bold = bold
-    run.italic = italic
-
-
-def _add_parsed_text(paragraph, text, font_size=None, bold=False, italic=False):
-    """Parse text for $$...$$ and $...$ blocks and insert as MathML or regular text."""
+def _add_parsed_text(paragraph, text, style=None):
+    """
+    Insert text as runs and its $$...$$ / $...$ segments as Office math.
+    Runs carry only an optional character style; fonts come from the styles.
+    """
     if not text:
         return
-    font_size = font_size or C.FONT_SIZE_BODY
-    pattern = re.compile(r'(\$\$.*?\$\$|\$.*?\$)', re.DOTALL)
-    parts = re.split(pattern, text)
-    
-    for part in parts:
-        if not part:
-            continue
-        if part.startswith('$$') and part.endswith('$$'):
-            math_str = part[2:-2].strip()
-            try:
-                math2docx.add_math(paragraph, math_str)
-            except Exception:
-                run = paragraph.add_run(part)
-                _apply(run, font_size=font_size, bold=bold, italic=italic)
-        elif part.startswith('$') and part.endswith('$'):
-            math_str = part[1:-1].strip()
-            try:
-                math2docx.add_math(paragraph, math_str)
-            except Exception:
-                run = paragraph.add_run(part)
-                _apply(run, font_size=font_size, bold=bold, italic=italic)
-        else:
-            run = paragraph.add_run(part)
-            _apply(run, font_size=font_size, bold=bold, italic=italic)
-
-
-def _set_cell_margins(cell, top=0, bottom=0, start=0, end=0):
-    """Set cell margins in EMUs (1 inch = 914400 EMUs)."""
-    tc = cell._tc
-    tcPr = tc.get_or_add_tcPr()
-    tcMar = tcPr.find(qn("w:tcMar"))
-    if tcMar is None:
-        tcMar = tc.makeelement(qn("w:tcMar"), {})
-        tcPr.append(tcMar)
-    for side, val in [("top", top), ("bottom", bottom), ("start", start), ("end", end)]:
-        el = tcMar.find(qn(f"w:{side}"))
-        if el is None:
-            el = tc.makeelement(qn(f"w:{side}"), {})
-            tcMar.append(el)
-        el.set(qn("w:w"), str(val))
-        el.set(qn("w:type"), "dxa")
-
-
-def _remove_table_borders(table):
-    """Remove all borders from a table so it looks invisible."""
-    tbl = table._tbl
-    tblPr = tbl.tblPr if tbl.tblPr is not None else tbl.makeelement(qn("w:tblPr"), {})
-    borders = tblPr.find(qn("w:tblBorders"))
-    if borders is None:
-        borders = tbl.makeelement(qn("w:tblBorders"), {})
-        tblPr.append(borders)
-    for edge in ("top", "left", "bottom", "right", "insideH", "insideV"):
-        el = borders.find(qn(f"w:{edge}"))
-        if el is None:
-            el = tbl.makeelement(qn(f"w:{edge}"), {})
-            borders.append(el)
-        el.set(qn("w:val"), "none")
-        el.set(qn("w:sz"), "0")
-        el.set(qn("w:space"), "0")
-        el.set(qn("w:color"), "auto")
+    for kind, value in text_segments.parse(text):
+        if kind != text_segments.TEXT:
+            element = math_cache.omml(value)
+            if element is not None:
+                paragraph._p.append(element)
+                continue
+            value = text_segments.source(kind, value)
+        paragraph.add_run(value, style)
+
+
+# ── Base document (built once per process) ──────────────────────────────────
+
+# Named styles; runs and paragraphs reference these instead of repeating rPr
+STYLE_BODY = "GSA Body"          # Paragraph: body text, info block, abstract
+STYLE_HEADING = "GSA Heading"    # Paragraph: "Abstract"
+STYLE_CAPTION = "GSA Caption"    # Paragraph: figure captions
+STYLE_NAME = "GSA Name"          # Character: student name
+STYLE_LABEL = "GSA Label"        # Character: "Research topic: " etc.
+TABLE_STYLE = "GSA Borderless"
+
+# Part of the artifact cache key: bump whenever the generated document changes,
+# so DOCX files cached by an older release are not served after a deploy.
+DOCX_FORMAT_VERSION = 4
+
+
+def _table_style_xml() -> str:
+    """tblPr for a borderless table style with config.py cell margins."""
+    pad = int(C.TABLE_CELL_MARGIN_H.twips)
+    edges = "".join(
+        f'<w:{edge} w:val="none" w:sz="0" w:space="0" w:color="auto"/>'
+        for edge in ("top", "left", "bottom", "right", "insideH", "insideV")
+    )
+    return (
+        f'<w:tblPr {nsdecls("w")}>'
+        f'<w:tblBorders>{edges}</w:tblBorders>'
+        f'<w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="{pad}" w:type="dxa"/>'
+        f'<w:bottom w:w="0" w:type="dxa"/><w:right w:w="{pad}" w:type="dxa"/></w:tblCellMar>'
+        f'</w:tblPr>'
+    )
+
+
+@functools.lru_cache(maxsize=1)
+def _base_docx() -> bytes:
+    """
+    Serialized empty document with page margins, default font and the
+    named paragraph, character and table styles applied. Parsing these bytes is cheaper than
+    Document() plus re-applying the setup for every submission.
+    """
+    doc = Document()
+    for section in doc.sections:
+        section.top_margin = C.PAGE_MARGIN
+        section.bottom_margin = C.PAGE_MARGIN
+        section.left_margin = C.PAGE_MARGIN
+        section.right_margin = C.PAGE_MARGIN
+
+    normal = doc.styles["Normal"]
+    normal.font.name = C.FONT_NAME
+    normal.font.size = C.FONT_SIZE_BODY
+    normal.font.color.rgb = RGBColor.from_string(C.FONT_COLOR_HEX)
+
+    styles = doc.styles
+    body = styles.add_style(STYLE_BODY, WD_STYLE_TYPE.PARAGRAPH)
+    body.base_style = normal
+    body.paragraph_format.space_after = C.SPACING_AFTER
+    body.paragraph_format.line_spacing = C.LINE_SPACING
+    body.paragraph_format.first_line_indent = Inches(0)
+
+    heading = styles.add_style(STYLE_HEADING, WD_STYLE_TYPE.PARAGRAPH)
+    heading.base_style = body
+    heading.font.size = C.FONT_SIZE_HEADING
+    heading.font.bold = True
+
+    caption = styles.add_style(STYLE_CAPTION, WD_STYLE_TYPE.PARAGRAPH)
+    caption.base_style = normal
+    caption.font.size = C.FONT_SIZE_CAPTION
+    caption.font.italic = True
+
+    name = styles.add_style(STYLE_NAME, WD_STYLE_TYPE.CHARACTER)
+    name.font.size = C.FONT_SIZE_NAME
+    name.font.bold = True
+
+    label = styles.add_style(STYLE_LABEL, WD_STYLE_TYPE.CHARACTER)
+    label.font.bold = True
+
+    table_style = doc.styles.add_style(TABLE_STYLE, WD_STYLE_TYPE.TABLE)
+    table_style.base_style = doc.styles["Normal Table"]
+    table_style.element.append(parse_xml(_table_style_xml()))
+
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _new_document():
+    """A fresh in-memory clone of the pre-styled base document."""
+    return Document(io.BytesIO(_base_docx()))
 
 
 def _para_spacing(paragraph, after=None, before=None):
@@ -103,29 +136,19 @@ def _para_spacing(paragraph, after=None, before=None):
     fmt.line_spacing = C.LINE_SPACING
 
 
-def _prep_image(uploaded_file, max_w_inches, max_h_inches):
-    """Open an uploaded image, resize proportionally, return BytesIO + dimensions."""
-    buf = io.BytesIO(uploaded_file.getvalue())
-    img = Image.open(buf)
-    img = img.convert("RGB")  # normalise RGBA / palette images
-
-    # Calculate proportional size capped by max dims
-    w_px, h_px = img.size
-    dpi = 96
-    max_w_px = int(max_w_inches * dpi)
-    max_h_px = int(max_h_inches * dpi)
-    ratio = min(max_w_px / w_px, max_h_px / h_px, 1.0)
-    new_w = int(w_px * ratio)
-    new_h = int(h_px * ratio)
-    img = img.resize((new_w, new_h), Image.LANCZOS)
+def _prep_image(uploaded_file, slot):
+    """Return the shared, size-capped derivative of an image as BytesIO + display width."""
+    derivative = image_pipeline.derive(uploaded_file, slot)
+    return io.BytesIO(derivative.data), Inches(derivative.width_in)
 
-    out = io.BytesIO()
-    img.save(out, format="PNG")
-    out.seek(0)
 
-    # Return width in inches for docx (capped)
-    width_in = min(new_w / dpi, max_w_inches)
-    return out, Inches(width_in)
+def _docx_cache_key(data: dict) -> str:
+    """Cache key over every scalar field (text, figure_scale) and the raw bytes of each image slot."""
+    image_keys = ("headshot", "figure_1", "figure_2")
+    text = repr(sorted((k, v) for k, v in data.items()
+                       if k not in image_keys and isinstance(v, (str, int, float))))
+    images = [data[k].getvalue() if data.get(k) else b"" for k in image_keys]
+    return artifact_cache.cache_key(f"docx-v{DOCX_FORMAT_VERSION}", text, *images)
 
 
 # ── Document Builder ─────────────────────────────────────────────────────────
@@ -141,21 +164,18 @@ def generate_docx(data: dict) -> io.BytesIO:
         abstract_p1, abstract_p2 (str, p2 may be empty),
         figure_1, caption_1, figure_2, caption_2
     """
-    doc = Document()
+    cache_key = _docx_cache_key(data)
+    cached = artifact_cache.get(cache_key, "docx")
+    if cached is not None:
+        return io.BytesIO(cached)
 
-    # ── Page setup ──
-    for section in doc.sections:
-        section.top_margin = C.PAGE_MARGIN
-        section.bottom_margin = C.PAGE_MARGIN
-        section.left_margin = C.PAGE_MARGIN
-        section.right_margin = C.PAGE_MARGIN
+    doc = _new_document()  # Margins and table style already applied
 
     # ──────────────────────────────────────────────────────────────────────
     # 1. HEADER — headshot | student information
     # ──────────────────────────────────────────────────────────────────────
-    header_table = doc.add_table(rows=1, cols=2)
+    header_table = doc.add_table(rows=1, cols=2, style=TABLE_STYLE)
     header_table.alignment = WD_TABLE_ALIGNMENT.CENTER
-    _remove_table_borders(header_table)
 
     # Column widths: headshot 2" + gutter 0.2" | rest
     col_headshot = header_table.columns[0]
@@ -170,22 +190,22 @@ def generate_docx(data: dict) -> io.BytesIO:
 
     # -- Headshot --
     if data.get("headshot"):
-        img_buf, img_w = _prep_image(data["headshot"], 2.0, 2.0)
+        img_buf, img_w = _prep_image(data["headshot"], image_pipeline.SLOT_HEADSHOT)
         p = cell_photo.paragraphs[0]
         run = p.add_run()
         run.add_picture(img_buf, width=C.HEADSHOT_WIDTH)
     else:
         p = cell_photo.paragraphs[0]
         run = p.add_run("[No Headshot]")
-        _apply(run, italic=True)
+        run.italic = True
 
     # -- Info block --
     p = cell_info.paragraphs[0]
+    p.style = STYLE_BODY
     p.alignment = WD_ALIGN_PARAGRAPH.LEFT
 
     # Student name (large bold)
-    run = p.add_run(data["student_name"])
-    _apply(run, font_size=C.FONT_SIZE_NAME, bold=True)
+    run = p.add_run(data["student_name"], STYLE_NAME)
     run.add_break()
 
     # Info lines
@@ -203,13 +223,10 @@ def generate_docx(data: dict) -> io.BytesIO:
     ])
 
     for label, value in info_lines:
-        run_label = p.add_run(label)
-        _apply(run_label, bold=True)
-        run_value = p.add_run(value)
-        _apply(run_value)
-        run_value.add_break()
+        p.add_run(label, STYLE_LABEL)
+        p.add_run(value).add_break()
 
-    _para_spacing(p, after=Pt(0))
+    p.paragraph_format.space_after = Pt(0)
 
     # ──────────────────────────────────────────────────────────────────────
     # 2. ABSTRACT
@@ -217,23 +234,16 @@ def generate_docx(data: dict) -> io.BytesIO:
     spacer = doc.add_paragraph()
     _para_spacing(spacer, before=C.SPACING_BEFORE_SECTION, after=Pt(0))
 
-    heading_p = doc.add_paragraph()
-    run = heading_p.add_run("Abstract")
-    _apply(run, font_size=C.FONT_SIZE_HEADING, bold=True)
-    _para_spacing(heading_p, after=C.SPACING_AFTER)
+    doc.add_paragraph("Abstract", STYLE_HEADING)
 
     # Paragraph 1 (required)
-    abs1 = doc.add_paragraph()
+    abs1 = doc.add_paragraph(style=STYLE_BODY)
     _add_parsed_text(abs1, data["abstract_p1"])
-    abs1.paragraph_format.first_line_indent = Inches(0)
-    _para_spacing(abs1, after=C.SPACING_AFTER)
 
     # Paragraph 2 (optional)
     if data.get("abstract_p2", "").strip():
-        abs2 = doc.add_paragraph()
+        abs2 = doc.add_paragraph(style=STYLE_BODY)
         _add_parsed_text(abs2, data["abstract_p2"])
-        abs2.paragraph_format.first_line_indent = Inches(0)
-        _para_spacing(abs2, after=C.SPACING_AFTER)
 
     # ──────────────────────────────────────────────────────────────────────
     # 3. FIGURES (side-by-side or single)
@@ -242,6 +252,7 @@ def generate_docx(data: dict) -> io.BytesIO:
     # Per new layout rule: if they have two paragraphs, there shouldn't be figures.
     has_fig1 = data.get("figure_1") is not None and not data.get("abstract_p2", "").strip()
     has_fig2 = data.get("figure_2") is not None and not data.get("abstract_p2", "").strip()
+    fig_scale = data.get("figure_scale") or 1.0  # Set by shrink-to-fit
 
     if has_fig1 or has_fig2:
         spacer = doc.add_paragraph()
@@ -249,9 +260,8 @@ def generate_docx(data: dict) -> io.BytesIO:
 
         if has_fig1 and has_fig2:
             # Two-column table for side-by-side figures
-            fig_table = doc.add_table(rows=2, cols=2)  # row 0: images, row 1: captions
+            fig_table = doc.add_table(rows=2, cols=2, style=TABLE_STYLE)  # row 0: images, row 1: captions
             fig_table.alignment = WD_TABLE_ALIGNMENT.CENTER
-            _remove_table_borders(fig_table)
             half = Inches(3.25)
             fig_table.columns[0].width = half
             fig_table.columns[1].width = half
@@ -261,21 +271,22 @@ def generate_docx(data: dict) -> io.BytesIO:
                 cap_key = f"caption_{idx + 1}"
 
                 # Image cell
-                img_buf, img_w = _prep_image(data[fig_key], 3.0, 2.2)
+                img_buf, img_w = _prep_image(data[fig_key], image_pipeline.SLOT_FIGURE_PAIR)
                 cell = fig_table.rows[0].cells[col]
                 p = cell.paragraphs[0]
                 p.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 run = p.add_run()
-                run.add_picture(img_buf, width=img_w)
+                run.add_picture(img_buf, width=Emu(int(img_w * fig_scale)))
 
                 # Caption cell
                 cap_cell = fig_table.rows[1].cells[col]
                 cap_p = cap_cell.paragraphs[0]
+                cap_p.style = STYLE_CAPTION
                 cap_p.alignment = WD_ALIGN_PARAGRAPH.LEFT
                 caption_text = data.get(cap_key, "")
                 
-                _add_parsed_text(cap_p, f"Figure {idx + 1}. ", font_size=C.FONT_SIZE_CAPTION, italic=True)
-                _add_parsed_text(cap_p, caption_text, font_size=C.FONT_SIZE_CAPTION, italic=True)
+                _add_parsed_text(cap_p, f"Figure {idx + 1}. ")
+                _add_parsed_text(cap_p, caption_text)
 
         else:
             # Single figure — centered
@@ -283,21 +294,20 @@ def generate_docx(data: dict) -> io.BytesIO:
             cap_key = "caption_1" if has_fig1 else "caption_2"
             fig_num = 1 if has_fig1 else 2
 
-            img_buf, img_w = _prep_image(data[fig_key], 4.5, 2.7)
+            img_buf, img_w = _prep_image(data[fig_key], image_pipeline.SLOT_FIGURE_SINGLE)
             fig_p = doc.add_paragraph()
             fig_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
             run = fig_p.add_run()
-            run.add_picture(img_buf, width=img_w)
+            run.add_picture(img_buf, width=Emu(int(img_w * fig_scale)))
 
             caption_text = data.get(cap_key, "")
             if caption_text:
-                cap_p = doc.add_paragraph()
+                cap_p = doc.add_paragraph(f"Figure {fig_num}. {caption_text}", STYLE_CAPTION)
                 cap_p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                run = cap_p.add_run(f"Figure {fig_num}. {caption_text}")
-                _apply(run, font_size=C.FONT_SIZE_CAPTION, italic=True)
 
     # ── Save to memory ──
     buf = io.BytesIO()
     doc.save(buf)
+    artifact_cache.put(cache_key, "docx", buf.getvalue())
     buf.seek(0)
     return buf
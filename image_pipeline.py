@@ -0,0 +1,253 @@
+"""
+image_pipeline.py — Canonical, size-capped image derivatives shared by the
+PDF and DOCX generators.
+
+Each upload is decoded once per slot (headshot, side-by-side figure, single
+figure), downscaled to at most IMAGE_DERIVATIVE_DPI at the slot's printed
+size, and kept in its original format. JPEGs are decoded in draft mode, so a
+10 MB photo is never expanded to full resolution. Derivatives are cached by
+content hash, so both generators and repeated clicks reuse the same bytes.
+The live preview gets tiny WebP thumbnails from the same kind of cache.
+
+Uploads are checked from their header alone (inspect) before anything is
+decoded: pixel count, aspect ratio and a format that matches the extension.
+EXIF orientation is applied to every derivative and thumbnail.
+"""
+
+import base64
+import collections
+import hashlib
+import io
+import os
+import threading
+from typing import NamedTuple
+
+from PIL import Image, ImageOps, features
+
+import config as C
+
+# Printed box (width, height) in inches for each image slot
+SLOT_HEADSHOT = "headshot"
+SLOT_FIGURE_PAIR = "figure_pair"
+SLOT_FIGURE_SINGLE = "figure_single"
+SLOTS = {
+    SLOT_HEADSHOT: (2.0, 2.0),
+    SLOT_FIGURE_PAIR: (3.0, 2.2),
+    SLOT_FIGURE_SINGLE: (4.5, 2.7),
+}
+
+# Nominal resolution used for the DOCX display size of small images
+_DISPLAY_DPI = 96
+
+# Upload extension -> the format Pillow must detect in the header
+_EXTENSION_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG"}
+_EXIF_ORIENTATION = 0x0112
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)   # Width and height swap when applied
+
+# Pillow's own bomb check is a backstop for code paths that skip inspect()
+Image.MAX_IMAGE_PIXELS = C.MAX_IMAGE_PIXELS
+
+
+class ImageRejected(ValueError):
+    """An upload that must not be decoded; the message is shown to the user."""
+
+
+class ImageInfo(NamedTuple):
+    format: str         # "JPEG" or "PNG"
+    width_px: int       # As stored (before EXIF orientation)
+    height_px: int
+    mode: str
+    orientation: int    # EXIF orientation tag, 1 when absent
+
+
+class Derivative(NamedTuple):
+    data: bytes
+    ext: str            # "jpg" or "png"
+    width_px: int
+    height_px: int
+    width_in: float     # Display width in the DOCX (never upscaled past 96 dpi)
+
+
+_cache = collections.OrderedDict()
+_cache_lock = threading.Lock()
+
+_thumbs = collections.OrderedDict()   # content hash -> data URI
+_THUMB_FORMAT = ("WEBP", "image/webp") if features.check("webp") else ("JPEG", "image/jpeg")
+
+
+def image_bytes(source) -> bytes:
+    """Raw bytes of an UploadedFile, file path or bytes object."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    return source.getvalue()
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _open_header(stream) -> tuple:
+    """Open an image lazily (header only) and enforce the pixel limits."""
+    try:
+        img = Image.open(stream)
+    except Image.DecompressionBombError:
+        raise ImageRejected(
+            f"is too large (limit {C.MAX_IMAGE_PIXELS / 1e6:.0f} megapixels)") from None
+    except Exception:
+        raise ImageRejected("is not a readable JPG or PNG image") from None
+
+    w_px, h_px = img.size
+    if w_px * h_px > C.MAX_IMAGE_PIXELS:
+        raise ImageRejected(f"is {w_px}×{h_px} pixels "
+                            f"(limit {C.MAX_IMAGE_PIXELS / 1e6:.0f} megapixels)")
+    if min(w_px, h_px) < 1 or max(w_px, h_px) / min(w_px, h_px) > C.MAX_IMAGE_ASPECT:
+        raise ImageRejected(f"has an extreme aspect ratio ({w_px}×{h_px} pixels)")
+    # Only JPEG EXIF is parsed with the header; on a PNG getexif() decodes
+    # the whole image looking for a trailing eXIf chunk.
+    orientation = 1
+    if img.format == "JPEG":
+        try:
+            orientation = int(img.getexif().get(_EXIF_ORIENTATION, 1))
+        except Exception:
+            pass  # Corrupt EXIF block: ignore it rather than reject
+    return img, orientation
+
+
+def inspect(source, name=None) -> ImageInfo:
+    """
+    Validate an upload from its header only: byte size (from .size where
+    available, so nothing is copied), pixel count, aspect ratio and a format
+    that matches the file extension. Raises ImageRejected.
+    """
+    size = getattr(source, "size", None)
+    if size is None:
+        size = len(image_bytes(source))
+    if size > C.MAX_IMAGE_SIZE_BYTES:
+        raise ImageRejected(f"exceeds {C.MAX_IMAGE_SIZE_MB} MB")
+
+    if isinstance(source, (bytes, bytearray)):
+        stream = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        stream = open(source, "rb")
+    elif hasattr(source, "seek") and hasattr(source, "read"):
+        stream = source   # UploadedFile: read the header in place
+    else:
+        stream = io.BytesIO(image_bytes(source))
+    position = stream.tell()
+    try:
+        img, orientation = _open_header(stream)
+        fmt, mode = img.format, img.mode
+        w_px, h_px = img.size
+    finally:
+        if stream is source:
+            stream.seek(position)
+        else:
+            stream.close()
+
+    name = name or getattr(source, "name", None) or (source if isinstance(source, str) else "")
+    ext = os.path.splitext(str(name))[1].lower().lstrip(".")
+    if fmt not in _EXTENSION_FORMATS.values():
+        raise ImageRejected(f"is a {fmt or 'unknown'} image, not JPG or PNG")
+    if ext in _EXTENSION_FORMATS and _EXTENSION_FORMATS[ext] != fmt:
+        raise ImageRejected(f"is a {fmt} file saved with a .{ext} extension")
+    return ImageInfo(fmt, w_px, h_px, mode, orientation)
+
+
+def derive(source, slot: str) -> Derivative:
+    """Return the cached derivative of an image for one slot."""
+    raw = image_bytes(source)
+    key = (content_hash(raw), slot)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+
+    derivative = _derive(raw, slot)
+
+    with _cache_lock:
+        _cache[key] = derivative
+        while len(_cache) > C.IMAGE_CACHE_MAX_ITEMS:
+            _cache.popitem(last=False)
+    return derivative
+
+
+def _derive(raw: bytes, slot: str) -> Derivative:
+    max_w_in, max_h_in = SLOTS[slot]
+    img, orientation = _open_header(io.BytesIO(raw))
+    fmt = img.format
+    w_px, h_px = img.size
+    rotated = orientation in _TRANSPOSED_ORIENTATIONS
+    if rotated:
+        w_px, h_px = h_px, w_px   # Sizes below are for the upright image
+
+    # Same display-size rule docx_generator has always used
+    display_ratio = min(max_w_in * _DISPLAY_DPI / w_px, max_h_in * _DISPLAY_DPI / h_px, 1.0)
+    width_in = min(int(w_px * display_ratio) / _DISPLAY_DPI, max_w_in)
+
+    dpi = C.IMAGE_DERIVATIVE_DPI
+    ratio = min(max_w_in * dpi / w_px, max_h_in * dpi / h_px, 1.0)
+    target = (max(1, int(w_px * ratio)), max(1, int(h_px * ratio)))
+    ext = "jpg" if fmt == "JPEG" else "png"
+
+    if ratio == 1.0 and fmt in ("JPEG", "PNG") and orientation == 1:
+        # Already small enough and upright: keep the upload's bytes untouched
+        return Derivative(raw, ext, w_px, h_px, width_in)
+
+    if fmt == "JPEG":
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers target
+        img.draft("RGB", target[::-1] if rotated else target)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA")  # Palette / 16-bit images resize poorly
+    if orientation != 1:
+        img = ImageOps.exif_transpose(img)
+    img = img.resize(target, Image.LANCZOS)
+
+    out = io.BytesIO()
+    if ext == "jpg":
+        img.save(out, format="JPEG", quality=C.IMAGE_JPEG_QUALITY)
+    else:
+        img.save(out, format="PNG")
+    return Derivative(out.getvalue(), ext, target[0], target[1], width_in)
+
+
+# ── Preview thumbnails ──────────────────────────────────────────────────────
+
+def thumbnail_uri(source) -> str:
+    """A data: URI for a THUMBNAIL_MAX_PX preview of an image, cached by content hash."""
+    raw = image_bytes(source)
+    key = content_hash(raw)
+    with _cache_lock:
+        hit = _thumbs.get(key)
+        if hit is not None:
+            _thumbs.move_to_end(key)
+            return hit
+
+    size = (C.THUMBNAIL_MAX_PX, C.THUMBNAIL_MAX_PX)
+    img, orientation = _open_header(io.BytesIO(raw))
+    if img.format == "JPEG":
+        img.draft("RGB", size)
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+        img = img.convert("RGBA")  # Palette / 16-bit images cannot be thumbnailed
+    img.thumbnail(size)
+    if orientation != 1:
+        img = ImageOps.exif_transpose(img)
+    fmt, mime = _THUMB_FORMAT
+    keep_alpha = fmt == "WEBP" and img.mode in ("RGBA", "LA")
+    img = img.convert("RGBA" if keep_alpha else "RGB")  # Cheap at thumbnail size
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=75)
+    uri = f"data:{mime};base64,{base64.b64encode(out.getvalue()).decode('ascii')}"
+
+    with _cache_lock:
+        _thumbs[key] = uri
+        while len(_thumbs) > C.THUMBNAIL_CACHE_ITEMS:
+            _thumbs.popitem(last=False)
+    return uri
@@ -0,0 +1,227 @@
+"""
+jobs.py — Background report generation, decoupled from Streamlit reruns.
+
+app.py submits a job and keeps only its id in session state; the PDF/DOCX
+work runs on a thread pool. Status, progress and results live here, so a
+rerun or a reconnecting browser simply polls the same job again and the
+script thread is never blocked by pdflatex.
+
+A session has one live job. Resubmitting identical input returns the
+running job; changed input cancels it (a queued compile leaves the
+scheduler at once) and the new job starts when the old one has stopped.
+
+Polling (get) doubles as a heartbeat: jobs nobody has polled for
+JOB_ABANDON_S are cancelled at the next stage boundary, and finished
+results not fetched for JOB_RESULT_TTL_S are dropped.
+"""
+
+import concurrent.futures
+import math
+import threading
+import time
+import uuid
+
+import config as C
+from compile_pool import CompileCancelled, CompileRateLimited
+from tex_engine import TexCancelled
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+_SWEEP_INTERVAL_S = 10
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+class Job:
+    """One generation request; fields are written by the worker, read by polls."""
+
+    def __init__(self, session_id, key=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.key = key              # Identity of the input, for resubmits
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting to start…"
+        self.result = None          # Set when DONE
+        self.error = None           # Exception when FAILED
+        self.created = self.last_seen = time.monotonic()
+        self.finished = None
+        self.future = None
+        self.cancel_event = threading.Event()   # Also handed to the compile scheduler
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def update(self, progress: float, message: str) -> None:
+        """Report progress from the worker; raises JobCancelled if cancelled."""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.progress, self.message = progress, message
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self._finish(CANCELLED)
+
+    def _finish(self, status, result=None, error=None) -> None:
+        self.result, self.error = result, error
+        self.finished = time.monotonic()
+        self.status = status
+
+
+class JobManager:
+    """Runs jobs on a thread pool and keeps their state until collected."""
+
+    def __init__(self, max_workers: int):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gsa-job")
+        self._jobs = {}
+        self._by_session = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def submit(self, session_id, fn, /, *args, job_key=None, **kwargs) -> str:
+        """
+        Start fn(job, *args, **kwargs) in the background and return the job id.
+
+        A session has at most one live job. If job_key matches the session's
+        queued, running or finished job, that job's id is returned instead;
+        otherwise the older job is cancelled and the new one waits for it to
+        stop, so the two never compete for the session's compile slot.
+        """
+        with self._lock:
+            previous = self._jobs.get(self._by_session.get(session_id))
+            if (previous is not None and job_key is not None and previous.key == job_key
+                    and previous.status not in (FAILED, CANCELLED) and not previous.cancelled):
+                previous.last_seen = time.monotonic()
+                return previous.id
+            job = Job(session_id, job_key)
+            self._jobs[job.id] = job
+            self._by_session[session_id] = job.id
+        if previous is not None and previous.status not in FINISHED:
+            previous.cancel()
+        else:
+            previous = None
+        job.future = self._executor.submit(self._run, job, previous, fn, args, kwargs)
+        self._sweep()
+        return job.id
+
+    def _run(self, job, previous, fn, args, kwargs) -> None:
+        if previous is not None and previous.future is not None:
+            job.message = "Stopping the previous request…"
+            concurrent.futures.wait([previous.future])
+        if job.cancelled:
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        try:
+            result = fn(job, *args, **kwargs)
+        except (JobCancelled, CompileCancelled, TexCancelled):
+            job._finish(CANCELLED)
+        except Exception as exc:
+            job._finish(FAILED, error=exc)
+        else:
+            job.progress, job.message = 1.0, "Done"
+            job._finish(DONE, result=result)
+
+    def get(self, job_id):
+        """Return the job (or None once collected) and record the poll."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.last_seen = time.monotonic()
+        self._sweep()
+        return job
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED}
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+    def _sweep(self) -> None:
+        """Cancel abandoned jobs and drop stale results (at most every few seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < _SWEEP_INTERVAL_S:
+                return
+            self._last_sweep = now
+            abandoned, expired = [], []
+            for job in self._jobs.values():
+                idle = now - job.last_seen
+                if job.status in FINISHED:
+                    if idle > C.JOB_RESULT_TTL_S:
+                        expired.append(job)
+                elif idle > C.JOB_ABANDON_S:
+                    abandoned.append(job)
+            for job in expired:
+                del self._jobs[job.id]
+                if self._by_session.get(job.session_id) == job.id:
+                    del self._by_session[job.session_id]
+        for job in abandoned:
+            job.cancel()
+
+
+# ── Report generation job ───────────────────────────────────────────────────
+
+def generate_reports(job: Job, data: dict, session_id=None, auto_shrink: bool = False) -> dict:
+    """
+    The work behind "Validate & Generate Reports": PDF (optionally shrunk to
+    fit), DOCX, then a copy in the submission store. Returns a dict with
+    pdf, docx (bytes), base_name and figure_scale.
+    """
+    from bulk_export import report_basename
+    from docx_generator import generate_docx
+    from latex_generator import generate_pdf
+    from shrink_to_fit import generate_pdf_shrunk
+    from submission_store import store
+
+    def on_queue(position):
+        job.update(0.05, f"Compile server is busy — you are #{position} in line.")
+
+    data = dict(data)
+    job.update(0.1, "Typesetting PDF…")
+    for attempt in range(3):
+        try:
+            if auto_shrink:
+                pdf_io, scale = generate_pdf_shrunk(data, session_id=session_id, on_queue=on_queue,
+                                                    cancel=job.cancel_event)
+                data["figure_scale"] = scale
+            else:
+                pdf_io = generate_pdf(data, session_id=session_id, on_queue=on_queue,
+                                      cancel=job.cancel_event)
+            break
+        except CompileRateLimited as exc:
+            # The job this one replaced compiled moments ago: wait, don't fail
+            if attempt == 2:
+                raise
+            job.update(0.05, f"Starting in {math.ceil(exc.retry_after)} s…")
+            if job.cancel_event.wait(exc.retry_after):
+                raise JobCancelled() from None
+            job.update(0.1, "Typesetting PDF…")
+
+    job.update(0.8, "Building DOCX…")
+    doc_io = generate_docx(data)
+
+    job.update(0.95, "Saving submission…")
+    pdf, docx = pdf_io.getvalue(), doc_io.getvalue()
+    try:
+        store.save(data, pdf=pdf, docx=docx, session_id=session_id)
+    except OSError:
+        pass  # The downloads still work without a stored copy
+    return {"pdf": pdf, "docx": docx, "base_name": report_basename(data),
+            "figure_scale": data.get("figure_scale") or 1.0}
+
+
+# Shared by every session in this server process
+manager = JobManager(C.JOB_MAX_WORKERS)
@@ -0,0 +1,109 @@
+"""
+latex_format.py — Precompiled pdflatex format for the fixed template preamble.
+
+Loading fontenc, helvet, graphicx, geometry, parskip and caption is a large
+share of every compile. The preamble never changes, so it is dumped once into
+a custom format file; compiles then only typeset the document body.
+
+The format name includes a hash of the preamble and of the TeX installation,
+so editing the preamble or upgrading TeX Live builds a fresh format.
+"""
+
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import config as C
+import tex_engine
+
+_build_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def _tex_fingerprint() -> str:
+    """Identify the installed pdflatex and its base format, or "" if absent."""
+    try:
+        version = subprocess.run(
+            ["pdflatex", "--version"],
+            capture_output=True, text=True, errors="replace", check=False,
+        ).stdout
+        base_fmt = subprocess.run(
+            ["kpsewhich", "-engine=pdftex", "pdflatex.fmt"],
+            capture_output=True, text=True, errors="replace", check=False,
+        ).stdout.strip()
+    except OSError:
+        return ""
+    stamp = ""
+    if base_fmt:
+        try:
+            st = os.stat(base_fmt)
+            stamp = f"{base_fmt}:{st.st_size}:{st.st_mtime_ns}"
+        except OSError:
+            pass
+    return f"{version}\n{stamp}"
+
+
+def format_name(preamble: str) -> str:
+    """Format file name (without .fmt) for this preamble and TeX installation."""
+    h = hashlib.sha256(preamble.encode("utf-8"))
+    h.update(_tex_fingerprint().encode("utf-8"))
+    return f"gsa_preamble_{h.hexdigest()[:16]}"
+
+
+def current_format(preamble: str):
+    """
+    Return (format_dir, format_name) if an up-to-date format exists, else None.
+    Never builds: the hot path must not pay for a format dump.
+    """
+    if not C.LATEX_FORMAT_ENABLED or not _tex_fingerprint():
+        return None
+    name = format_name(preamble)
+    if os.path.exists(os.path.join(C.LATEX_FORMAT_DIR, f"{name}.fmt")):
+        return C.LATEX_FORMAT_DIR, name
+    return None
+
+
+def ensure_format(preamble: str):
+    """
+    Build the format for this preamble if it is missing (startup step).
+    Returns (format_dir, format_name), or None if pdflatex cannot dump it.
+    """
+    fmt = current_format(preamble)
+    if fmt or not C.LATEX_FORMAT_ENABLED or not _tex_fingerprint():
+        return fmt
+
+    with _build_lock:
+        fmt = current_format(preamble)
+        if fmt:
+            return fmt
+
+        name = format_name(preamble)
+        build_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(build_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+                f.write(preamble)
+                f.write("\n\\dump\n")
+            tex_engine.run(
+                ["pdflatex", "-ini", "-interaction=nonstopmode",
+                 f"-jobname={name}", "&pdflatex", "preamble.tex"],
+                cwd=build_dir,
+            )
+            built = os.path.join(build_dir, f"{name}.fmt")
+            if not os.path.exists(built):
+                return None
+
+            # Rename into place so concurrent processes never see a partial file
+            os.makedirs(C.LATEX_FORMAT_DIR, exist_ok=True)
+            staged = os.path.join(C.LATEX_FORMAT_DIR, f"{name}.fmt.{os.getpid()}.tmp")
+            shutil.copyfile(built, staged)
+            os.replace(staged, os.path.join(C.LATEX_FORMAT_DIR, f"{name}.fmt"))
+        except (OSError, tex_engine.TexEngineError):
+            return None
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    return current_format(preamble)
@@ -3,55 +3,35 @@ latex_generator.py — Generates a compiled PDF and a LaTeX ZIP using the
 provided exact Template.tex structure but customized.
 """
 
+import collections
+import contextlib
 import io
 import os
+import threading
 import zipfile
-import subprocess
-import shutil
-import tempfile
 import re
-from jinja2 import Environment, BaseLoader
+from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
 
+import artifact_cache
 import config as C
+from compile_pool import scheduler
+import image_pipeline
+import latex_format
+import page_estimator
+import tex_engine
+import text_segments
+import workdir_pool
 
 # Escape latex special chars
 def escape_latex(text: str) -> str:
+    """Escape LaTeX specials in text segments; math segments pass through raw."""
     if not text:
         return ""
-    # Very basic escaping to prevent latex compilation errors
-    replacements = {
-        "\\": "\\textbackslash{}",
-        "&": "\\&",
-        "%": "\\%",
-        "$": "\\$",
-        "#": "\\#",
-        "_": "\\_",
-        "{": "\\{",
-        "}": "\\}",
-        "~": "\\textasciitilde{}",
-        "^": "\\textasciicircum{}",
-    }
-    def _escape(s):
-        escaped = "".join(replacements.get(c, c) for c in s)
-        return escaped.replace("\n", "\\\\")
-
-    pattern = re.compile(r'(\$\$.*?\$\$|\$.*?\$)', re.DOTALL)
-    parts = re.split(pattern, text)
-    
-    result = []
-    for part in parts:
-        if not part:
-            continue
-        if part.startswith('$') and part.endswith('$'):
-            # Pass math blocks raw
-            result.append(part)
-        else:
-            result.append(_escape(part))
-            
-    return "".join(result)
+    return text_segments.to_latex(text)
 
-# The Jinja2 Template (matches exactly Template.tex but with variables)
-LATEX_TEMPLATE = r"""\documentclass[12pt]{article}
+# The fixed preamble. It never contains template variables, so it can be
+# dumped once into a pdflatex format (see latex_format.py).
+LATEX_PREAMBLE = r"""\documentclass[12pt]{article}
 
 % Font and formatting packages
 \usepackage[T1]{fontenc}
@@ -65,7 +45,12 @@ LATEX_TEMPLATE = r"""\documentclass[12pt]{article}
 % Set figure caption styling to match template requirements
 \captionsetup[figure]{font={sf,it,normalsize}, labelsep=period, justification=raggedright, singlelinecheck=false}
 
-\begin{document}
+% Report the final page count in the log (also works under -draftmode)
+\AtEndDocument{\clearpage\typeout{GSA-PAGES:\the\numexpr\value{page}-1\relax}}
+"""
+
+# The Jinja2 document body
+LATEX_BODY = r"""\begin{document}
 
 % --- Header Section (Fixed for No Overlap) ---
 \noindent
@@ -113,23 +98,23 @@ LATEX_TEMPLATE = r"""\documentclass[12pt]{article}
     % Two Column Layout
     \begin{minipage}[t]{0.48\textwidth}
         \centering
-        \includegraphics[width=\textwidth, height=2.2in, keepaspectratio]{ {{figure_1_filename}} }
+        \includegraphics[width=\textwidth, height={{figure_pair_height}}, keepaspectratio]{ {{figure_1_filename}} }
         \caption{ {{caption_1}} }
     \end{minipage}
     \hfill
     \begin{minipage}[t]{0.48\textwidth}
         \centering
-        \includegraphics[width=\textwidth, height=2.2in, keepaspectratio]{ {{figure_2_filename}} }
+        \includegraphics[width=\textwidth, height={{figure_pair_height}}, keepaspectratio]{ {{figure_2_filename}} }
         \caption{ {{caption_2}} }
     \end{minipage}
     {% else %}
     % One Column Layout
     {% if figure_1_filename %}
-    \includegraphics[width=0.6\textwidth, height=2.7in, keepaspectratio]{ {{figure_1_filename}} }
+    \includegraphics[width=0.6\textwidth, height={{figure_single_height}}, keepaspectratio]{ {{figure_1_filename}} }
     \caption{ {{caption_1}} }
     {% endif %}
     {% if figure_2_filename %}
-    \includegraphics[width=0.6\textwidth, height=2.7in, keepaspectratio]{ {{figure_2_filename}} }
+    \includegraphics[width=0.6\textwidth, height={{figure_single_height}}, keepaspectratio]{ {{figure_2_filename}} }
     \caption{ {{caption_2}} }
     {% endif %}
     {% endif %}
@@ -139,11 +124,90 @@ LATEX_TEMPLATE = r"""\documentclass[12pt]{article}
 \end{document}
 """
 
+# The Jinja2 Template (matches exactly Template.tex but with variables)
+LATEX_TEMPLATE = LATEX_PREAMBLE + "\n" + LATEX_BODY
 
-def _generate_latex_source(data: dict) -> str:
-    """Uses Jinja2 to populate the LaTeX template with the user's data"""
-    env = Environment(loader=BaseLoader())
-    template = env.from_string(LATEX_TEMPLATE)
+
+# ── Template registry ────────────────────────────────────────────────────────
+# Every layout gets its own named templates ("<layout>/main.tex" and
+# "<layout>/body.tex"). They all share LATEX_TEMPLATE today; an event-specific
+# variant only needs a new entry in _TEMPLATE_SOURCES.
+LAYOUT_TEXT_ONLY = "text_only"
+LAYOUT_TWO_PARAGRAPHS = "two_paragraphs"
+LAYOUT_FIGURES = "figures"
+LAYOUTS = (LAYOUT_TEXT_ONLY, LAYOUT_TWO_PARAGRAPHS, LAYOUT_FIGURES)
+
+# Part of the ZIP cache key: bump whenever the archive layout changes
+# (PDFs are keyed by their full LaTeX source, which needs no salt).
+ZIP_FORMAT_VERSION = 2
+
+_TEMPLATE_SOURCES = {}
+for _layout in LAYOUTS:
+    _TEMPLATE_SOURCES[f"{_layout}/main.tex"] = LATEX_TEMPLATE
+    _TEMPLATE_SOURCES[f"{_layout}/body.tex"] = LATEX_BODY
+
+def _bytecode_cache():
+    """On-disk Jinja bytecode cache so new worker processes start warm."""
+    try:
+        os.makedirs(C.JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(C.JINJA_BYTECODE_CACHE_DIR)
+
+_ENV = Environment(
+    loader=DictLoader(_TEMPLATE_SOURCES),
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=False,
+    cache_size=-1,
+)
+# Compiled once at import time; rendering never parses a template again
+TEMPLATES = {name: _ENV.get_template(name) for name in _TEMPLATE_SOURCES}
+
+def layout_of(data: dict) -> str:
+    """The submission's layout name, inferred from its fields if not given."""
+    layout = data.get("layout")
+    if layout in LAYOUTS:
+        return layout
+    if data.get("abstract_p2"):
+        return LAYOUT_TWO_PARAGRAPHS
+    if data.get("figure_1") or data.get("figure_2"):
+        return LAYOUT_FIGURES
+    return LAYOUT_TEXT_ONLY
+
+def get_template(layout: str, body_only: bool = False):
+    """Look up a precompiled template by layout name."""
+    return TEMPLATES[f"{layout}/{'body' if body_only else 'main'}.tex"]
+
+
+def _image_files(data: dict) -> dict:
+    """
+    Map each uploaded image slot to (filename, derivative bytes).
+    The extension follows the derivative, which keeps the upload's format.
+    """
+    if data.get("figure_1") and data.get("figure_2"):
+        figure_slot = image_pipeline.SLOT_FIGURE_PAIR
+    else:
+        figure_slot = image_pipeline.SLOT_FIGURE_SINGLE
+    files = {}
+    for key, base, slot in (("headshot", "headshot", image_pipeline.SLOT_HEADSHOT),
+                            ("figure_1", "figure1", figure_slot),
+                            ("figure_2", "figure2", figure_slot)):
+        if data.get(key):
+            derivative = image_pipeline.derive(data[key], slot)
+            files[key] = (f"{base}.{derivative.ext}", derivative.data)
+    return files
+
+def _generate_latex_source(data: dict, body_only: bool = False, images: dict = None) -> str:
+    """
+    Uses Jinja2 to populate the LaTeX template with the user's data.
+    With body_only, renders just the document body for a precompiled format.
+    images is the result of _image_files(data), computed here if omitted.
+    data["figure_scale"] (default 1.0) scales the figure box heights.
+    """
+    template = get_template(layout_of(data), body_only=body_only)
+    if images is None:
+        images = _image_files(data)
+    scale = data.get("figure_scale") or 1.0
 
     # Determine filenames if images are present
     context = {
@@ -159,86 +223,219 @@ def _generate_latex_source(data: dict) -> str:
         "abstract_p2": escape_latex(data.get("abstract_p2", "")),
         "caption_1": escape_latex(data.get("caption_1", "")),
         "caption_2": escape_latex(data.get("caption_2", "")),
-        "headshot_filename": "headshot.png" if data.get("headshot") else None,
-        "figure_1_filename": "figure1.png" if data.get("figure_1") else None,
-        "figure_2_filename": "figure2.png" if data.get("figure_2") else None,
+        "figure_pair_height": f"{2.2 * scale:.3f}in",
+        "figure_single_height": f"{2.7 * scale:.3f}in",
+        "headshot_filename": images["headshot"][0] if "headshot" in images else None,
+        "figure_1_filename": images["figure_1"][0] if "figure_1" in images else None,
+        "figure_2_filename": images["figure_2"][0] if "figure_2" in images else None,
     }
 
     return template.render(**context)
 
-def _save_image_to_disk(uploaded_file, filepath):
-    """Saves a streamlit UploadedFile to disk."""
+def _save_image_to_disk(payload: bytes, filepath):
+    """Writes image derivative bytes to disk."""
     with open(filepath, "wb") as f:
-        f.write(uploaded_file.getvalue())
-
-def generate_pdf(data: dict) -> io.BytesIO:
-    """Generates a PDF using pdflatex. Returns a BytesIO object of the PDF."""
-    tex_content = _generate_latex_source(data)
-
-    # Work inside a temporary directory
-    temp_dir = tempfile.mkdtemp()
-    try:
-        tex_path = os.path.join(temp_dir, "main.tex")
-        with open(tex_path, "w", encoding="utf-8") as f:
-            f.write(tex_content)
-
-        if data.get("headshot"):
-            _save_image_to_disk(data["headshot"], os.path.join(temp_dir, "headshot.png"))
-        if data.get("figure_1"):
-            _save_image_to_disk(data["figure_1"], os.path.join(temp_dir, "figure1.png"))
-        if data.get("figure_2"):
-            _save_image_to_disk(data["figure_2"], os.path.join(temp_dir, "figure2.png"))
-
-        # Compile twice to resolve references/layout properly
-        subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", "main.tex"],
-            cwd=temp_dir,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-        
-        result = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", "main.tex"],
-            cwd=temp_dir,
-            capture_output=True,
-            text=True,
-            check=False
-        )
-
-        import re
-        # Look for "Output written on main.pdf (X pages"
-        match = re.search(r"Output written on main\.pdf \((\d+)\s+page", result.stdout)
-        if match:
-            pages = int(match.group(1))
-            if pages > 1:
-                raise ValueError("Submission exceeds 1 page limit.")
+        f.write(payload)
+
+# "Output written on main.pdf (X pages" is only printed when a PDF is written,
+# so the template also reports its page count via \typeout for draft passes.
+_PAGES_MARKER_RE = re.compile(r"GSA-PAGES:(\d+)")
+_PAGES_OUTPUT_RE = re.compile(r"Output written on main\.pdf \((\d+)\s+page")
+_RERUN_RE = re.compile(r"Rerun to get|Please rerun LaTeX|\(rerunfilecheck\)")
+
+def _run_pdflatex(work_dir, draft=False, fmt=None, timeout=None, cancel=None):
+    """
+    Run one pdflatex pass over main.tex and return its stdout log.
+    fmt is a (format_dir, format_name) pair from latex_format, or None.
+    timeout overrides both the wall-clock and CPU limits (long documents);
+    setting the cancel event stops the run (tex_engine.TexCancelled).
+    """
+    args = ["pdflatex", "-interaction=nonstopmode"]
+    env = None
+    if fmt:
+        format_dir, format_name = fmt
+        args.append(f"-fmt={format_name}")
+        # Trailing separator keeps the default search path after ours
+        env = dict(os.environ, TEXFORMATS=format_dir + os.pathsep)
+    if draft:
+        # Typesets fully but skips image inclusion and PDF writing
+        args.append("-draftmode")
+    args.append("main.tex")
+    return tex_engine.run(args, cwd=work_dir, env=env, timeout=timeout, cpu_limit=timeout,
+                          cancel=cancel)
+
+def _page_count(log):
+    """Number of pages reported in a pdflatex log, or None if unknown."""
+    match = _PAGES_MARKER_RE.search(log) or _PAGES_OUTPUT_RE.search(log)
+    return int(match.group(1)) if match else None
+
+def _check_page_limit(log):
+    pages = _page_count(log)
+    if pages is not None and pages > 1:
+        raise ValueError("Submission exceeds 1 page limit.")
+
+def _compile(work_dir, fmt=None, draft_check=True, cancel=None) -> str:
+    """
+    Compile main.tex in work_dir and return the final pass's log.
+
+    A -draftmode pass rejects over-long submissions before any image is
+    embedded; the output pass that follows is only repeated when its log
+    asks for a rerun (the template has no cross-references, so it rarely does).
+    draft_check=False skips the draft pass when the estimator already says
+    the page fits; the output pass still enforces the limit.
+    """
+    passes = 0
+    if draft_check:
+        log = _run_pdflatex(work_dir, draft=True, fmt=fmt, cancel=cancel)
+        _check_page_limit(log)
+        passes += 1
+
+    log = _run_pdflatex(work_dir, fmt=fmt, cancel=cancel)
+    passes += 1
+    while _RERUN_RE.search(log) and passes < C.LATEX_MAX_PASSES:
+        log = _run_pdflatex(work_dir, fmt=fmt, cancel=cancel)
+        passes += 1
+    _check_page_limit(log)
+    return log
+
+def _write_source(work_dir, body, fmt):
+    """Write main.tex: the body alone for a precompiled format, else the full source."""
+    with open(os.path.join(work_dir, "main.tex"), "w", encoding="utf-8") as f:
+        f.write(body if fmt else LATEX_PREAMBLE + "\n" + body)
+
+def build_format():
+    """Dump LATEX_PREAMBLE into a pdflatex format if needed. Call once at startup."""
+    return latex_format.ensure_format(LATEX_PREAMBLE)
+
+def _draft_pages(work_dir, body):
+    """One draft pass over body in work_dir; returns the page count or None."""
+    fmt = latex_format.current_format(LATEX_PREAMBLE)
+    _write_source(work_dir, body, fmt)
+    pages = _page_count(_run_pdflatex(work_dir, draft=True, fmt=fmt))
+    if fmt and pages is None:
+        _write_source(work_dir, body, None)
+        pages = _page_count(_run_pdflatex(work_dir, draft=True))
+    return pages
+
+# Page counts of recent draft trials, keyed by source + image content
+_page_memo = collections.OrderedDict()
+_page_memo_lock = threading.Lock()
+
+@contextlib.contextmanager
+def page_counter(data: dict):
+    """
+    Yield count(**overrides) -> pages for variants of data that share its images.
+
+    The images are written once and every trial reuses the same work directory
+    and precompiled preamble; results are memoized across calls. The caller
+    is responsible for holding a compile slot while counting.
+    """
+    images = _image_files(data)
+    image_key = artifact_cache.cache_key(*(payload for _, payload in images.values()))
+    with workdir_pool.pool.acquire() as temp_dir:
+        for filename, payload in images.values():
+            _save_image_to_disk(payload, os.path.join(temp_dir, filename))
+
+        def count(**overrides):
+            body = _generate_latex_source(dict(data, **overrides), body_only=True, images=images)
+            key = artifact_cache.cache_key(image_key, LATEX_PREAMBLE, body)
+            with _page_memo_lock:
+                if key in _page_memo:
+                    _page_memo.move_to_end(key)
+                    return _page_memo[key]
+            pages = _draft_pages(temp_dir, body)
+            if pages is not None:
+                with _page_memo_lock:
+                    _page_memo[key] = pages
+                    while len(_page_memo) > C.PAGE_COUNT_MEMO_ITEMS:
+                        _page_memo.popitem(last=False)
+            return pages
+
+        yield count
+
+def count_pages(data: dict):
+    """Typeset once in draft mode and return pdflatex's page count (no PDF is kept)."""
+    with page_counter(data) as count, scheduler.slot():
+        return count()
+
+def generate_pdf(data: dict, session_id=None, on_queue=None, use_estimate=True,
+                 speculative=False, cancel=None) -> io.BytesIO:
+    """
+    Generates a PDF using pdflatex. Returns a BytesIO object of the PDF.
+
+    Compiles go through the shared compile scheduler: session_id enables
+    per-session rate limiting and on_queue(position) is called while waiting;
+    setting the cancel event withdraws a queued request (CompileCancelled)
+    or stops a running compile (tex_engine.TexCancelled).
+    use_estimate=False ignores the page estimator (for callers that already
+    measured the page count with pdflatex). speculative=True only uses spare
+    capacity and raises compile_pool.CompileBusy instead of queueing.
+    """
+    images = _image_files(data)
+    body = _generate_latex_source(data, body_only=True, images=images)
+    cache_key = artifact_cache.cache_key(
+        "pdf", LATEX_PREAMBLE, body, *(payload for _, payload in images.values()))
+    cached = artifact_cache.get(cache_key, "pdf")
+    if cached is not None:
+        return io.BytesIO(cached)
+
+    # Only borderline submissions need pdflatex to decide the page limit
+    fit = page_estimator.verdict(page_estimator.estimate_fill(data)) if use_estimate else None
+    if fit == page_estimator.OVERFLOW and C.PAGE_ESTIMATE_REJECT:
+        raise ValueError("Submission exceeds 1 page limit.")
+
+    # Work inside a pooled, RAM-backed work directory
+    with workdir_pool.pool.acquire() as temp_dir:
+        for filename, payload in images.values():
+            _save_image_to_disk(payload, os.path.join(temp_dir, filename))
 
         pdf_path = os.path.join(temp_dir, "main.pdf")
+        draft_check = fit != page_estimator.FITS
+
+        slot = scheduler.speculative_slot(cancel) if speculative else scheduler.slot(session_id, on_queue, cancel)
+        with slot:
+            # Prefer the precompiled preamble; fall back to the full source if
+            # the format is missing or unusable with this TeX installation.
+            fmt = latex_format.current_format(LATEX_PREAMBLE)
+            if fmt:
+                _write_source(temp_dir, body, fmt)
+                log = _compile(temp_dir, fmt=fmt, draft_check=draft_check, cancel=cancel)
+            if not fmt or not os.path.exists(pdf_path):
+                _write_source(temp_dir, body, None)
+                log = _compile(temp_dir, draft_check=draft_check, cancel=cancel)
+
         if not os.path.exists(pdf_path):
-            raise RuntimeError(f"PDF failed to generate. LaTeX Log: {result.stdout}")
+            raise RuntimeError(f"PDF failed to generate. LaTeX Log: {log}")
 
         with open(pdf_path, "rb") as f:
             pdf_bytes = f.read()
 
+        artifact_cache.put(cache_key, "pdf", pdf_bytes)
         return io.BytesIO(pdf_bytes)
-    finally:
-        shutil.rmtree(temp_dir)
+
+def latex_bundle(data: dict):
+    """Return (main.tex source, [(filename, image bytes), ...]) for a submission."""
+    images = _image_files(data)
+    return _generate_latex_source(data, images=images), list(images.values())
 
 def generate_latex_zip(data: dict) -> io.BytesIO:
     """Generates a ZIP file in memory containing the latex source and images."""
-    tex_content = _generate_latex_source(data)
+    tex_content, images = latex_bundle(data)
+    cache_key = artifact_cache.cache_key(
+        f"zip-v{ZIP_FORMAT_VERSION}", tex_content, *(payload for _, payload in images))
+    cached = artifact_cache.get(cache_key, "zip")
+    if cached is not None:
+        return io.BytesIO(cached)
+
     zip_buffer = io.BytesIO()
 
     with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
         zip_file.writestr("main.tex", tex_content)
         
-        if data.get("headshot"):
-            zip_file.writestr("headshot.png", data["headshot"].getvalue())
-        if data.get("figure_1"):
-            zip_file.writestr("figure1.png", data["figure_1"].getvalue())
-        if data.get("figure_2"):
-            zip_file.writestr("figure2.png", data["figure_2"].getvalue())
+        # PNG/JPEG data is already compressed; deflating it again only costs CPU
+        for filename, payload in images:
+            zip_file.writestr(filename, payload, compress_type=zipfile.ZIP_STORED)
 
+    artifact_cache.put(cache_key, "zip", zip_buffer.getvalue())
     zip_buffer.seek(0)
     return zip_buffer
@@ -0,0 +1,111 @@
+"""
+manifest.py — Load submissions for the headless tools (bulk export, batch CLI).
+
+A manifest is a JSONL file with one submission per line, or a CSV file with
+one submission per row, using the same keys as the `data` dict app.py builds.
+A submission store database (.db, see submission_store.py) can be given
+instead; its latest submission per student is used. Image fields (headshot, figure_1, figure_2)
+hold file paths, relative to the manifest's directory unless absolute; they
+are wrapped in FileImage so generators can treat them like Streamlit uploads.
+
+A row that cannot be parsed does not stop the manifest: it is yielded as
+{ROW_ERROR: message}, which the tools report as a failed submission.
+"""
+
+import csv
+import json
+import os
+
+IMAGE_FIELDS = ("headshot", "figure_1", "figure_2")
+ROW_ERROR = "manifest_error"   # Key of the placeholder yielded for an unreadable row
+
+
+class FileImage:
+    """
+    Path-backed stand-in for Streamlit's UploadedFile.
+    Nothing touches the file until size or getvalue() is used, so a missing
+    image fails its own submission rather than the manifest; the file is
+    read at most once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._data = None
+
+    @property
+    def size(self) -> int:
+        if self._data is not None:
+            return len(self._data)
+        return os.path.getsize(self.path)
+
+    def getvalue(self) -> bytes:
+        if self._data is None:
+            with open(self.path, "rb") as f:
+                self._data = f.read()
+        return self._data
+
+    def __repr__(self) -> str:
+        return f"FileImage({self.path!r})"
+
+
+def _resolve(record: dict, base_dir: str) -> dict:
+    data = dict(record)
+    for field in IMAGE_FIELDS:
+        path = data.get(field)
+        if path:
+            data[field] = FileImage(os.path.join(base_dir, path))
+        else:
+            data[field] = None
+    return data
+
+
+def load_jsonl(path: str):
+    """Yield submission dicts lazily, one per non-blank line."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield {ROW_ERROR: f"{path}:{line_no}: invalid JSON ({exc})"}
+                continue
+            if not isinstance(record, dict):
+                yield {ROW_ERROR: f"{path}:{line_no}: expected a JSON object"}
+                continue
+            yield _resolve(record, base_dir)
+
+
+def load_csv(path: str):
+    """Yield submission dicts lazily, one per CSV row (header row = field names)."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if not any((v or "").strip() for v in row.values()):
+                continue
+            record = {k.strip(): v for k, v in row.items() if k}
+            if record.get("figure_scale"):
+                try:
+                    record["figure_scale"] = float(record["figure_scale"])
+                except ValueError:
+                    yield {ROW_ERROR: f"{path}:{reader.line_num}: figure_scale "
+                                      f"{record['figure_scale']!r} is not a number"}
+                    continue
+            yield _resolve(record, base_dir)
+
+
+def load_manifest(path: str):
+    """Yield submissions from a manifest file, chosen by its extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return load_jsonl(path)
+    if ext == ".csv":
+        return load_csv(path)
+    if ext in (".db", ".sqlite"):
+        from submission_store import SubmissionStore
+        blob_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "blobs")
+        return SubmissionStore(path, blob_dir).submissions()
+    raise ValueError(f"Unsupported manifest format: {ext or path}")
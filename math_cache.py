@@ -0,0 +1,71 @@
+"""
+math_cache.py — Process-wide memo of LaTeX math → Office Math (OMML).
+
+math2docx converts through latex2mathml and mathml2omml on every call, and
+the same formulas recur across retries, regenerations and sessions. Each
+normalized formula is converted once; callers get a private deep copy of the
+cached element to insert into their document. Formulas that fail to convert
+are remembered too, so they fall back to plain text without another attempt.
+"""
+
+import collections
+import copy
+import re
+import threading
+
+import math2docx
+
+import config as C
+
+_FAILED = object()   # Negative-cache marker
+
+_cache = collections.OrderedDict()
+_lock = threading.Lock()
+_counters = {"hits": 0, "misses": 0, "failures": 0}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize(latex: str) -> str:
+    """Cache key for a formula: whitespace is insignificant in math mode."""
+    return _WHITESPACE_RE.sub(" ", latex).strip()
+
+
+def omml(latex: str):
+    """
+    Return a fresh OMML element for a formula, or None when it cannot be
+    converted (the caller falls back to the LaTeX source as text).
+    """
+    key = normalize(latex)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            _counters["hits"] += 1
+            return None if hit is _FAILED else copy.deepcopy(hit)
+        _counters["misses"] += 1
+
+    try:
+        element = math2docx._formula(key)
+    except Exception:
+        element = _FAILED
+
+    with _lock:
+        if element is _FAILED:
+            _counters["failures"] += 1
+        _cache[key] = element
+        while len(_cache) > C.MATH_CACHE_MAX_ITEMS:
+            _cache.popitem(last=False)
+    return None if element is _FAILED else copy.deepcopy(element)
+
+
+def stats() -> dict:
+    with _lock:
+        return dict(_counters, size=len(_cache), max_items=C.MATH_CACHE_MAX_ITEMS)
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+        for name in _counters:
+            _counters[name] = 0
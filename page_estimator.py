@@ -0,0 +1,292 @@
+"""
+page_estimator.py — Fast analytic estimate of how much of the one-page limit
+a submission uses.
+
+Mirrors LATEX_TEMPLATE's geometry (12pt article, 1 in margins, 2 in header
+minipage, figure boxes) and uses Helvetica font metrics with greedy line
+breaking, so a full estimate takes microseconds instead of a pdflatex run.
+It is deliberately an estimate: generate_pdf only trusts it far from the
+limit, and `python page_estimator.py --calibrate` compares it with pdflatex.
+"""
+
+import re
+
+import config as C
+import image_pipeline
+import text_segments
+
+# ── Geometry (TeX points; 72.27 pt = 1 in) ──────────────────────────────────
+PT_PER_IN = 72.27
+TEXT_WIDTH = 6.5 * PT_PER_IN
+TEXT_HEIGHT = 9.0 * PT_PER_IN
+INFO_WIDTH = TEXT_WIDTH - 2.2 * PT_PER_IN   # \textwidth-2.2in minipage
+HEADSHOT_BOX = (2.0 * PT_PER_IN, 2.0 * PT_PER_IN)
+FIGURE_PAIR_BOX = (0.48 * TEXT_WIDTH, 2.2 * PT_PER_IN)
+FIGURE_SINGLE_BOX = (0.6 * TEXT_WIDTH, 2.7 * PT_PER_IN)
+
+NORMAL_SIZE, NORMAL_BASELINE = 12.0, 14.5   # \normalsize in 12pt article
+LARGE_SIZE, LARGE_BASELINE = 14.4, 18.0     # \large
+PARSKIP = 6.0                               # parskip package, skip=6pt
+SECTION_GAP = 30.0                          # \vspace{30pt}
+INTEXTSEP = 14.0                            # \intextsep for an [h] float
+CAPTION_SKIP = 10.0                         # caption package default skip
+DISPLAY_MATH_SKIP = 12.0                    # \abovedisplayskip / \belowdisplayskip
+
+# ── Helvetica metrics (1/1000 em, ASCII 32–126) ─────────────────────────────
+_REGULAR = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_DEFAULT_WIDTH = 556
+_SPACE, _SPACE_SHRINK = 278, 93      # T1 Helvetica interword glue
+_MATH_CHAR = 500                     # Rough width of one math source character
+
+
+def _word_width(word: str, size: float, bold: bool = False) -> float:
+    table = _BOLD if bold else _REGULAR
+    total = 0
+    for ch in word:
+        code = ord(ch) - 32
+        total += table[code] if 0 <= code < len(table) else _DEFAULT_WIDTH
+    return total * size / 1000.0
+
+
+def _tokens(text: str, size: float, bold: bool = False):
+    """
+    Split text into layout tokens: ("w", width) words, ("br",) forced breaks
+    and ("display", 0) display-math blocks.
+    """
+    out = []
+    for kind, value in text_segments.parse(text or ""):
+        if kind == text_segments.DISPLAY_MATH:
+            out.append(("display", 0.0))
+        elif kind == text_segments.INLINE_MATH:
+            # Inline math: no break inside, width from its source length
+            body = re.sub(r"\\[a-zA-Z]+", "x", value.replace(" ", ""))
+            out.append(("w", len(body) * _MATH_CHAR * size / 1000.0))
+        else:
+            lines = value.split("\n")
+            for i, line in enumerate(lines):
+                if i:
+                    out.append(("br",))
+                out.extend(("w", _word_width(w, size, bold)) for w in line.split())
+    return out
+
+
+def _count_lines(tokens, width: float, size: float):
+    """Greedy line breaking. Returns (text_lines, display_blocks)."""
+    space = _SPACE * size / 1000.0
+    shrink = _SPACE_SHRINK * size / 1000.0
+    lines, displays = 0, 0
+    line_w, gaps = None, 0
+    for tok in tokens:
+        if tok[0] == "w":
+            w = tok[1]
+            if line_w is None:
+                line_w, gaps = w, 0
+            elif line_w + space + w - (gaps + 1) * shrink <= width:
+                line_w += space + w
+                gaps += 1
+            else:
+                lines += 1
+                line_w, gaps = w, 0
+            # Words wider than the line overflow onto extra lines
+            while line_w > width:
+                lines += 1
+                line_w -= width
+        else:
+            if line_w is not None:
+                lines += 1
+            line_w = None
+            if tok[0] == "display":
+                displays += 1
+    if line_w is not None:
+        lines += 1
+    return lines, displays
+
+
+def _text_height(text: str, width: float) -> float:
+    lines, displays = _count_lines(_tokens(text, NORMAL_SIZE), width, NORMAL_SIZE)
+    return (lines * NORMAL_BASELINE
+            + displays * (NORMAL_BASELINE + 2 * DISPLAY_MATH_SKIP))
+
+
+def _image_height(source, slot: str, box) -> float:
+    """Printed height of an image scaled into box with keepaspectratio."""
+    box_w, box_h = box
+    if not source:
+        return box_h
+    try:
+        d = image_pipeline.derive(source, slot)
+    except Exception:
+        return box_h  # Unreadable image: assume the worst case
+    return min(box_h, box_w * d.height_px / max(d.width_px, 1))
+
+
+def _header_height(data: dict) -> float:
+    photo = _image_height(data.get("headshot"), image_pipeline.SLOT_HEADSHOT, HEADSHOT_BOX)
+    if not data.get("headshot"):
+        photo = NORMAL_BASELINE  # "[No Headshot]"
+
+    name_lines, _ = _count_lines(_tokens(data.get("student_name", ""), LARGE_SIZE, True),
+                                 INFO_WIDTH, LARGE_SIZE)
+    info = max(name_lines, 1) * LARGE_BASELINE + 8.0
+    fields = [("Research topic: ", data.get("research_topic", ""))]
+    if data.get("sponsor"):
+        fields.append(("Sponsor: ", data["sponsor"]))
+    fields += [
+        ("Degree objective: ", f"{data.get('degree', '')} ({data.get('year', '')})"),
+        ("Contact: ", data.get("contact_email", "")),
+        ("Advisor: ", data.get("advisor", "")),
+        ("Career goal: ", data.get("career_goal", "")),
+    ]
+    for label, value in fields:
+        toks = _tokens(label, NORMAL_SIZE, True) + _tokens(value, NORMAL_SIZE)
+        lines, _ = _count_lines(toks, INFO_WIDTH, NORMAL_SIZE)
+        info += max(lines, 1) * NORMAL_BASELINE + 2.0
+    return max(photo, info)
+
+
+def _caption_height(number: int, text: str, width: float) -> float:
+    return CAPTION_SKIP + _text_height(f"Figure {number}. {text or ''}", width)
+
+
+def _figures_height(data: dict) -> float:
+    fig1, fig2 = data.get("figure_1"), data.get("figure_2")
+    if not (fig1 or fig2):
+        return 0.0
+    scale = data.get("figure_scale") or 1.0
+    if fig1 and fig2:
+        col = FIGURE_PAIR_BOX[0]
+        box = (col, FIGURE_PAIR_BOX[1] * scale)
+        slot = image_pipeline.SLOT_FIGURE_PAIR
+        body = max(
+            _image_height(fig1, slot, box) + _caption_height(1, data.get("caption_1"), col),
+            _image_height(fig2, slot, box) + _caption_height(2, data.get("caption_2"), col),
+        )
+    else:
+        box = (FIGURE_SINGLE_BOX[0], FIGURE_SINGLE_BOX[1] * scale)
+        slot = image_pipeline.SLOT_FIGURE_SINGLE
+        body = 0.0
+        for number, fig, cap in ((1, fig1, "caption_1"), (2, fig2, "caption_2")):
+            if fig:
+                body += (_image_height(fig, slot, box)
+                         + _caption_height(number, data.get(cap), TEXT_WIDTH))
+    return PARSKIP + SECTION_GAP + INTEXTSEP + body + INTEXTSEP
+
+
+def estimate_fill(data: dict) -> float:
+    """Estimated fraction of the page the submission uses (1.0 = exactly full)."""
+    height = _header_height(data)
+    height += PARSKIP + SECTION_GAP + PARSKIP + LARGE_BASELINE
+    height += PARSKIP + _text_height(data.get("abstract_p1", ""), TEXT_WIDTH)
+    if data.get("abstract_p2"):
+        height += PARSKIP + _text_height(data["abstract_p2"], TEXT_WIDTH)
+    height += _figures_height(data)
+    return height / TEXT_HEIGHT
+
+
+FITS = "fits"
+BORDERLINE = "borderline"
+OVERFLOW = "overflow"
+
+
+def verdict(fill: float) -> str:
+    """Classify an estimate: only BORDERLINE needs pdflatex to decide."""
+    if fill <= 1.0 - C.PAGE_ESTIMATE_MARGIN:
+        return FITS
+    if fill > 1.0 + C.PAGE_ESTIMATE_MARGIN:
+        return OVERFLOW
+    return BORDERLINE
+
+
+# ── Calibration against real pdflatex runs ──────────────────────────────────
+
+def calibrate(samples):
+    """
+    Compile each sample with pdflatex and compare with the estimate.
+    Returns a list of (estimated_fill, actual_pages, consistent) tuples;
+    a FITS estimate is inconsistent with 2 pages and OVERFLOW with 1 page.
+    A failed compile has pages None and consistent None.
+    """
+    import latex_generator
+
+    rows = []
+    for data in samples:
+        fill = estimate_fill(data)
+        pages = latex_generator.count_pages(data)
+        v = verdict(fill)
+        if pages is None:
+            consistent = None
+        else:
+            consistent = not ((v == FITS and pages > 1) or (v == OVERFLOW and pages <= 1))
+        rows.append((fill, pages, consistent))
+    return rows
+
+
+def _png(width: int, height: int) -> bytes:
+    import io
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 200, 200)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def _synthetic_samples():
+    """
+    Submissions sweeping the layouts past the limit: text-only abstracts,
+    one or two figures (landscape and portrait) with captions, and
+    abstracts with display math.
+    """
+    words = ("Geotechnical characterisation of compacted soils under cyclic "
+             "loading with moisture dependent stiffness and strength").split()
+    text = lambda n: " ".join(words[i % len(words)] for i in range(n))
+    base = {
+        "student_name": "Jane Doe", "research_topic": "Cyclic behaviour of soils",
+        "sponsor": "NSF", "degree": "PhD", "year": "2026",
+        "contact_email": "jane@unr.edu", "advisor": "Dr. Smith", "career_goal": "Academic",
+    }
+    for n in range(100, 901, 50):
+        yield dict(base, abstract_p1=text(n))
+
+    landscape, portrait = _png(1600, 900), _png(900, 1200)
+    for n in range(50, 301, 50):
+        for figure in (landscape, portrait):
+            yield dict(base, layout="figures", abstract_p1=text(n),
+                       figure_1=figure, caption_1=text(25))
+            yield dict(base, layout="figures", abstract_p1=text(n),
+                       figure_1=figure, caption_1=text(50),
+                       figure_2=landscape, caption_2=text(50))
+
+    equation = r"$$\sigma'_v = \gamma z - u + \sum_{i=1}^{n} \frac{q_i}{1 + k_i}$$"
+    for n in (150, 250, 350):
+        for displays in (2, 4, 6):
+            chunk = max(1, n // (displays + 1))
+            parts = [text(chunk) for _ in range(displays + 1)]
+            yield dict(base, abstract_p1=f" {equation} ".join(parts))
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--calibrate" not in sys.argv:
+        sys.exit("usage: python page_estimator.py --calibrate")
+    bad = 0
+    for fill, pages, ok in calibrate(_synthetic_samples()):
+        bad += not ok
+        status = "ok" if ok else ("COMPILE FAILED" if ok is None else "MISMATCH")
+        print(f"estimate {fill:6.1%}  {verdict(fill):<10}  pdflatex pages {pages}  {status}")
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,73 @@
+"""
+shrink_to_fit.py — Opt-in search for the largest figure size that still fits
+the submission on one page.
+
+Trials only run draft-mode passes against one shared work directory (images
+written once, precompiled preamble), their page counts are memoized, and the
+search checks the analytic page estimate's best scale and its neighbour,
+then bisects the fixed grid of scales, so a typical search costs two
+draft passes and a bad estimate at most six.
+"""
+
+import config as C
+import latex_generator
+import page_estimator
+from compile_pool import scheduler
+
+
+def _scales():
+    """Candidate figure scales in ascending order, ending at 1.0."""
+    steps = int(round((1.0 - C.SHRINK_MIN_SCALE) / C.SHRINK_STEP))
+    return [round(1.0 - i * C.SHRINK_STEP, 4) for i in range(steps, -1, -1)]
+
+
+def _estimate_seed(data: dict, scales):
+    """Index of the largest scale the estimator thinks fits, or None if none does."""
+    seed = None
+    for i, scale in enumerate(scales):
+        if page_estimator.estimate_fill(dict(data, figure_scale=scale)) <= 1.0:
+            seed = i
+    return seed
+
+
+def largest_fitting_scale(data: dict, session_id=None, on_queue=None, cancel=None):
+    """
+    Return the largest figure scale in [SHRINK_MIN_SCALE, 1.0] whose PDF is
+    one page, or None if even the smallest figures overflow.
+    """
+    scales = _scales()
+    seed = _estimate_seed(data, scales)
+    lo, hi = -1, len(scales)   # scales[lo] fits, scales[hi] overflows
+
+    with latex_generator.page_counter(data) as count, scheduler.slot(session_id, on_queue, cancel):
+        probe = (lo + hi) // 2 if seed is None else seed
+        first = seed is not None
+        while hi - lo > 1:
+            pages = count(figure_scale=scales[probe])
+            if pages is not None and pages <= 1:
+                lo, neighbour = probe, probe + 1
+            else:
+                hi, neighbour = probe, probe - 1
+            # The estimator is usually within a step: try the seed's
+            # neighbour once, then bisect what is left
+            probe = neighbour if first and lo < neighbour < hi else (lo + hi) // 2
+            first = False
+
+    return scales[lo] if lo >= 0 else None
+
+
+def generate_pdf_shrunk(data: dict, session_id=None, on_queue=None, cancel=None):
+    """
+    Generate the PDF with figures shrunk just enough to fit on one page.
+    Returns (pdf BytesIO, scale). Raises the usual page-limit ValueError
+    when no scale fits.
+    """
+    if not (data.get("figure_1") or data.get("figure_2")):
+        return latex_generator.generate_pdf(data, session_id, on_queue, cancel=cancel), 1.0
+    scale = largest_fitting_scale(data, session_id, on_queue, cancel)
+    if scale is None:
+        raise ValueError("Submission exceeds 1 page limit.")
+    # The final compile is a new request from the same session, not a retry
+    pdf = latex_generator.generate_pdf(dict(data, figure_scale=scale), on_queue=on_queue,
+                                       use_estimate=False, cancel=cancel)
+    return pdf, scale
@@ -0,0 +1,84 @@
+"""
+speculative.py — Debounced background compilation of the current draft.
+
+app.py has no st.form, so every keystroke reruns the script. Once a draft
+passes validation and stays unchanged for SPECULATIVE_IDLE_S seconds, its PDF
+is compiled in the background. The result lands in the artifact cache, so
+the "Validate & Generate Reports" click usually becomes a cache hit.
+
+Speculative compiles only use spare scheduler capacity (see
+CompileScheduler.speculative_slot) and never delay a real submit. A compile
+whose draft has changed, or whose session submitted, is stopped through its
+cancel event, and a session's entry is dropped once its compile finishes.
+"""
+
+import threading
+
+import artifact_cache
+import config as C
+
+_lock = threading.Lock()
+_pending = {}   # session_id -> (fingerprint, threading.Timer, threading.Event cancel)
+
+
+def fingerprint(data: dict) -> str:
+    """Identity of a draft: every text field plus the image contents."""
+    image_keys = ("headshot", "figure_1", "figure_2")
+    text = repr(sorted((k, v) for k, v in data.items()
+                       if k not in image_keys and isinstance(v, (str, float, int))))
+    images = [data[k].getvalue() if data.get(k) else b"" for k in image_keys]
+    return artifact_cache.cache_key("draft", text, *images)
+
+
+def schedule(session_id: str, data: dict) -> None:
+    """
+    (Re)arm the idle timer for this session's draft. An unchanged draft keeps
+    its timer; a changed one cancels the stale timer (or running compile)
+    and starts a new one. After a compile finishes, the same draft is
+    scheduled again on the next rerun, which is then an artifact cache hit.
+    """
+    if not C.SPECULATIVE_ENABLED:
+        return
+    fp = fingerprint(data)
+    with _lock:
+        current = _pending.get(session_id)
+        if current is not None:
+            if current[0] == fp:
+                return
+            _stop(current)
+        stop = threading.Event()
+        timer = threading.Timer(C.SPECULATIVE_IDLE_S, _run, args=(session_id, fp, data, stop))
+        timer.daemon = True
+        _pending[session_id] = (fp, timer, stop)
+        timer.start()
+
+
+def cancel(session_id: str) -> None:
+    """Drop this session's pending speculative compile and stop a running one."""
+    with _lock:
+        current = _pending.pop(session_id, None)
+    if current is not None:
+        _stop(current)
+
+
+def _stop(entry) -> None:
+    _, timer, stop = entry
+    timer.cancel()
+    stop.set()
+
+
+def _run(session_id: str, fp: str, data: dict, stop: threading.Event) -> None:
+    if stop.is_set():
+        return  # Superseded while the timer fired
+
+    from latex_generator import generate_pdf
+    try:
+        generate_pdf(data, speculative=True, cancel=stop)
+    except Exception:
+        pass  # Busy, cancelled or failed: errors surface on the real submit
+    finally:
+        # Drop the entry (and with it the draft's uploaded images)
+        with _lock:
+            current = _pending.get(session_id)
+            if current is not None and current[2] is stop:
+                del _pending[session_id]
@@ -0,0 +1,201 @@
+"""
+submission_store.py — Persistent store of submitted reports.
+
+Submission metadata lives in SQLite (WAL mode); uploaded images and the
+generated PDF/DOCX are written once to a content-addressed blob directory
+keyed by SHA-256, so resubmissions and figures shared across a lab are
+stored a single time. Rows are queued and committed by one background
+writer in batches, so concurrent sessions never wait on each other's
+transactions.
+
+    from submission_store import store
+    store.save(data, pdf=pdf_bytes, docx=docx_bytes, session_id=...)
+    for data in store.submissions(): ...   # latest per contact email
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+
+import config as C
+from manifest import IMAGE_FIELDS, FileImage
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id           INTEGER PRIMARY KEY,
+    created      REAL NOT NULL,
+    session_id   TEXT,
+    contact_email TEXT,
+    student_name TEXT,
+    fields       TEXT NOT NULL,      -- JSON of every text field
+    headshot     TEXT,               -- Blob digests
+    figure_1     TEXT,
+    figure_2     TEXT,
+    pdf          TEXT,
+    docx         TEXT
+);
+CREATE INDEX IF NOT EXISTS submissions_email ON submissions (contact_email, id);
+"""
+
+_INSERT = (
+    "INSERT INTO submissions (created, session_id, contact_email, student_name, fields, "
+    "headshot, figure_1, figure_2, pdf, docx) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+_STOP = object()
+
+
+class SubmissionStore:
+    """SQLite metadata plus a SHA-256 blob directory; writes go through one thread."""
+
+    def __init__(self, db_path: str, blob_dir: str):
+        self.db_path = db_path
+        self.blob_dir = blob_dir
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer = None
+
+    # ── Blobs ──
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def put_blob(self, payload: bytes) -> str:
+        """Store bytes once under their SHA-256; returns the digest."""
+        digest = hashlib.sha256(payload).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)   # Same content either way if two writers race
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    # ── Database ──
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")   # Durable at checkpoints; fine for WAL
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _ensure_writer(self) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="submission-store",
+                                                daemon=True)
+                self._writer.start()
+                atexit.register(self.close)
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is _STOP:
+                self._queue.task_done()
+                break
+            batch = [row]
+            deadline = time.monotonic() + C.STORE_COMMIT_INTERVAL_S
+            while len(batch) < C.STORE_COMMIT_BATCH:
+                try:
+                    row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(row)
+            try:
+                with conn:
+                    conn.executemany(_INSERT, batch)
+            except sqlite3.Error:
+                pass   # The store is a record, never a reason to fail a request
+            for _ in batch:
+                self._queue.task_done()
+        conn.close()
+
+    # ── Public API ──
+
+    def save(self, data: dict, pdf: bytes = None, docx: bytes = None, session_id: str = None) -> None:
+        """Store images and artifacts now; queue the metadata row for the next batch."""
+        if not C.STORE_ENABLED:
+            return
+        images = {}
+        fields = {k: v for k, v in data.items()
+                  if k not in IMAGE_FIELDS and isinstance(v, (str, int, float))}
+        for key in IMAGE_FIELDS:
+            upload = data.get(key)
+            if upload:
+                images[key] = self.put_blob(upload.getvalue())
+                fields[f"{key}_name"] = getattr(upload, "name", "")
+        row = (
+            time.time(), session_id, data.get("contact_email"), data.get("student_name"),
+            json.dumps(fields, ensure_ascii=False),
+            images.get("headshot"), images.get("figure_1"), images.get("figure_2"),
+            self.put_blob(pdf) if pdf else None,
+            self.put_blob(docx) if docx else None,
+        )
+        self._ensure_writer()
+        self._queue.put(row)
+
+    def flush(self) -> None:
+        """Block until every queued row is committed."""
+        if self._writer is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """Commit queued rows and stop the writer (registered with atexit)."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(_STOP)
+            writer.join()
+
+    def _image(self, digest, name) -> FileImage:
+        image = FileImage(self.blob_path(digest))
+        if name:
+            image.name = name   # Keep the upload's extension for validation
+        return image
+
+    def submissions(self, latest_only: bool = True):
+        """
+        Yield stored submissions as generator-ready data dicts, oldest first.
+        With latest_only, only the newest row per contact email is returned.
+        Images are path-backed FileImage objects read on first use.
+        """
+        if not os.path.exists(self.db_path):
+            return
+        conn = self._connect()
+        try:
+            query = ("SELECT id, fields, headshot, figure_1, figure_2 FROM submissions "
+                     + ("WHERE id IN (SELECT MAX(id) FROM submissions GROUP BY contact_email) "
+                        if latest_only else "")
+                     + "ORDER BY id")
+            for row_id, fields, *digests in conn.execute(query):
+                data = json.loads(fields)
+                data["submission_id"] = row_id
+                for key, digest in zip(IMAGE_FIELDS, digests):
+                    data[key] = self._image(digest, data.pop(f"{key}_name", "")) if digest else None
+                yield data
+        finally:
+            conn.close()
+
+
+# Shared by every session in this process
+store = SubmissionStore(C.STORE_DB_PATH, C.STORE_BLOB_DIR)
@@ -0,0 +1,127 @@
+"""
+tex_engine.py — Bounded execution of TeX engine subprocesses.
+
+Every pdflatex run gets a wall-clock timeout, CPU-time and address-space
+rlimits, and its own process group, so one pathological submission (deeply
+nested math, a huge image) cannot tie up a compile slot indefinitely.
+"""
+
+import os
+import signal
+import subprocess
+import time
+
+import config as C
+
+try:
+    import resource
+except ImportError:  # Windows: no rlimits, timeout only
+    resource = None
+
+_CANCEL_POLL_S = 0.2   # How often a cancellable run checks its event
+
+
+class TexEngineError(RuntimeError):
+    """The TeX engine could not finish a run."""
+
+
+class TexTimeoutError(TexEngineError):
+    """The run exceeded its wall-clock timeout and was killed."""
+
+
+class TexResourceError(TexEngineError):
+    """The run was killed by its CPU or memory limit."""
+
+
+class TexCancelled(TexEngineError):
+    """The run was stopped because its cancel event was set."""
+
+
+def _apply_limits(pid: int, cpu_limit=None) -> None:
+    """Set CPU and memory rlimits on a freshly started process (Linux only)."""
+    if resource is None or not hasattr(resource, "prlimit"):
+        return
+    cpu_limit = C.LATEX_CPU_LIMIT_S if cpu_limit is None else cpu_limit
+    try:
+        if cpu_limit:
+            cpu = int(cpu_limit)
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 1))
+        if C.LATEX_MEMORY_LIMIT_MB:
+            mem = int(C.LATEX_MEMORY_LIMIT_MB) * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (mem, mem))
+    except (OSError, ValueError):
+        pass  # Process already exited or limits not permitted
+
+
+def _kill_group(proc) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+
+def _communicate(proc, timeout, cancel):
+    """proc.communicate(timeout), waking regularly to honour the cancel event."""
+    if cancel is None:
+        return proc.communicate(timeout=timeout)[0]
+    deadline = time.monotonic() + timeout
+    while True:
+        if cancel.is_set():
+            raise TexCancelled("Typesetting was cancelled.")   # run() kills the group
+        remaining = deadline - time.monotonic()
+        try:
+            return proc.communicate(timeout=max(0.0, min(_CANCEL_POLL_S, remaining)))[0]
+        except subprocess.TimeoutExpired:
+            if remaining <= _CANCEL_POLL_S:
+                raise
+
+
+def run(args, cwd, env=None, timeout=None, cpu_limit=None, cancel=None) -> str:
+    """
+    Run a TeX engine command and return its stdout log.
+
+    timeout and cpu_limit (seconds) default to LATEX_TIMEOUT_S and
+    LATEX_CPU_LIMIT_S. A non-zero exit status is not an error here (pdflatex
+    reports recoverable problems that way); callers inspect the log and
+    output files instead. Setting the cancel event (a threading.Event)
+    kills the run and raises TexCancelled.
+    """
+    timeout = C.LATEX_TIMEOUT_S if timeout is None else timeout
+    proc = subprocess.Popen(
+        args,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors="replace",
+        # New process group, so a timeout also kills any helpers TeX spawned
+        start_new_session=(os.name == "posix"),
+    )
+    _apply_limits(proc.pid, cpu_limit)
+
+    try:
+        log = _communicate(proc, timeout, cancel)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        proc.communicate()
+        raise TexTimeoutError(
+            f"Typesetting took longer than {timeout:.0f} s and was stopped. "
+            "Try simplifying math or using smaller images."
+        )
+    except BaseException:
+        _kill_group(proc)
+        proc.wait()
+        raise
+
+    killed_by = -proc.returncode if proc.returncode < 0 else None
+    if killed_by in (getattr(signal, "SIGXCPU", None), signal.SIGKILL, signal.SIGSEGV):
+        raise TexResourceError(
+            "Typesetting used too much CPU time or memory and was stopped. "
+            "Try simplifying math or using smaller images."
+        )
+    return log
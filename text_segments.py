@@ -0,0 +1,110 @@
+"""
+text_segments.py — One parse of each form field into text / math segments,
+shared by the LaTeX, DOCX and HTML preview renderers.
+
+`$$...$$` is display math, `$...$` is inline math and `\\$` is a literal
+dollar sign. An unmatched `$` stays literal text. Parses and renders are
+memoized by field content, so Streamlit reruns of unchanged fields cost a
+dictionary lookup. The HTML preview renders math to MathML on the server,
+memoized per formula, so it needs no client-side typesetting or network.
+"""
+
+import functools
+import re
+
+import latex2mathml.converter
+
+import config as C
+
+TEXT = "text"
+INLINE_MATH = "inline"
+DISPLAY_MATH = "display"
+
+# Escaped dollar | display math | inline math (backslash escapes allowed inside)
+_TOKEN_RE = re.compile(
+    r"\\\$"
+    r"|\$\$((?:\\.|[^\\$]|\$(?!\$))*?)\$\$"
+    r"|\$((?:\\.|[^\\$])*?)\$",
+    re.DOTALL,
+)
+
+_LATEX_ESCAPES = str.maketrans({
+    "\\": "\\textbackslash{}",
+    "&": "\\&",
+    "%": "\\%",
+    "$": "\\$",
+    "#": "\\#",
+    "_": "\\_",
+    "{": "\\{",
+    "}": "\\}",
+    "~": "\\textasciitilde{}",
+    "^": "\\textasciicircum{}",
+    "\n": "\\\\",
+})
+
+_HTML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+
+
+@functools.lru_cache(maxsize=C.SEGMENT_CACHE_ITEMS)
+def parse(text: str) -> tuple:
+    """Split text into a tuple of (kind, value) segments; math values exclude delimiters."""
+    if not text:
+        return ()
+    segments = []
+    pending = []   # Text pieces not yet emitted (merged across escaped dollars)
+    pos = 0
+    for match in _TOKEN_RE.finditer(text):
+        pending.append(text[pos:match.start()])
+        pos = match.end()
+        display, inline = match.group(1), match.group(2)
+        if display is None and inline is None:
+            pending.append("$")   # \$
+            continue
+        if any(pending):
+            segments.append((TEXT, "".join(pending)))
+        pending = []
+        if display is not None:
+            segments.append((DISPLAY_MATH, display))
+        else:
+            segments.append((INLINE_MATH, inline))
+    pending.append(text[pos:])
+    if any(pending):
+        segments.append((TEXT, "".join(pending)))
+    return tuple(segments)
+
+
+def source(kind: str, value: str) -> str:
+    """The original LaTeX spelling of a segment (math with its delimiters)."""
+    if kind == DISPLAY_MATH:
+        return f"$${value}$$"
+    if kind == INLINE_MATH:
+        return f"${value}$"
+    return value
+
+
+@functools.lru_cache(maxsize=C.SEGMENT_CACHE_ITEMS)
+def to_latex(text: str) -> str:
+    """Escape text for LaTeX, passing math segments through raw."""
+    return "".join(value.translate(_LATEX_ESCAPES) if kind == TEXT else source(kind, value)
+                   for kind, value in parse(text))
+
+
+def escape_html(text: str) -> str:
+    return (text or "").translate(_HTML_ESCAPES)
+
+
+@functools.lru_cache(maxsize=C.MATH_CACHE_MAX_ITEMS)
+def math_to_html(kind: str, value: str) -> str:
+    """MathML for one math segment; the escaped LaTeX source if it does not convert."""
+    try:
+        return latex2mathml.converter.convert(
+            value.strip(), display="block" if kind == DISPLAY_MATH else "inline")
+    except Exception:
+        return f'<code class="math-error">{escape_html(source(kind, value))}</code>'
+
+
+@functools.lru_cache(maxsize=C.SEGMENT_CACHE_ITEMS)
+def to_html(text: str) -> str:
+    """HTML-escape text and render its math segments as MathML."""
+    return "".join(escape_html(value) if kind == TEXT else math_to_html(kind, value)
+                   for kind, value in parse(text))
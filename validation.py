@@ -0,0 +1,94 @@
+"""
+validation.py — Submission rules shared by app.py and the headless tools.
+
+validate() takes the same `data` dict the generators use and returns the
+error messages app.py shows on submit (Markdown, field names in bold).
+"""
+
+import config as C
+import image_pipeline
+from latex_generator import LAYOUT_FIGURES, LAYOUT_TWO_PARAGRAPHS, layout_of
+
+FIGURES_MAX_WORDS = 200   # Abstract limit when the layout has figures
+
+
+def word_count(text) -> int:
+    return len(text.split()) if text and text.strip() else 0
+
+
+def valid_email(email: str) -> bool:
+    return "@" in email and "." in email.split("@")[-1]
+
+
+def image_error(f, label: str):
+    """Header-only upload check; returns an error message or None."""
+    if f is None:
+        return None
+    try:
+        image_pipeline.inspect(f)
+    except image_pipeline.ImageRejected as exc:
+        return f"**{label}** {exc}."
+    return None
+
+
+def validate(data: dict) -> list:
+    """Every rule the submit button enforces; an empty list means valid."""
+    errors = []
+    layout = layout_of(data)
+    is_two_paragraphs = layout == LAYOUT_TWO_PARAGRAPHS
+    is_figures = layout == LAYOUT_FIGURES
+    get = lambda key: data.get(key) or ""
+
+    required = {
+        "Full Name": get("student_name"), "Graduate Program": get("graduate_program"),
+        "Graduation Year": get("year"), "Contact Email": get("contact_email"),
+        "Advisor": get("advisor"), "Research Topic": get("research_topic"),
+        "Abstract": get("abstract_p1"),
+    }
+    if is_two_paragraphs:
+        required["Abstract Paragraph 2"] = get("abstract_p2")
+
+    for label, val in required.items():
+        if not val.strip():
+            errors.append(f"**{label}** is required.")
+
+    p1w = word_count(get("abstract_p1"))
+    p2w = word_count(get("abstract_p2"))
+    total_w = p1w + p2w
+
+    if is_two_paragraphs:
+        if p1w > C.ABSTRACT_MAX_WORDS_P1:
+            errors.append(f"**Paragraph 1** exceeds {C.ABSTRACT_MAX_WORDS_P1} words ({p1w} used).")
+        if total_w > C.ABSTRACT_MAX_WORDS_TOTAL:
+            errors.append(f"**Total abstract** exceeds {C.ABSTRACT_MAX_WORDS_TOTAL} words ({total_w} used).")
+    elif is_figures:
+        if p1w > FIGURES_MAX_WORDS:
+            errors.append(f"**Abstract** exceeds {FIGURES_MAX_WORDS} words ({p1w} used).")
+    else:
+        if p1w > C.ABSTRACT_MAX_WORDS_TOTAL:
+            errors.append(f"**Abstract** exceeds {C.ABSTRACT_MAX_WORDS_TOTAL} words ({p1w} used).")
+
+    topic_w = word_count(get("research_topic"))
+    if topic_w > C.RESEARCH_TOPIC_MAX_WORDS:
+        errors.append(f"**Research Topic** exceeds {C.RESEARCH_TOPIC_MAX_WORDS} words ({topic_w} used).")
+
+    for n in (1, 2):
+        cap_w = word_count(get(f"caption_{n}"))
+        if cap_w > C.CAPTION_MAX_WORDS:
+            errors.append(f"**Caption {n}** exceeds {C.CAPTION_MAX_WORDS} words ({cap_w} used).")
+
+    email, year = get("contact_email"), get("year")
+    if email and not valid_email(email):
+        errors.append("Please enter a valid **email address**.")
+    if year and (not year.strip().isdigit() or len(year.strip()) != 4):
+        errors.append("**Graduation Year** must be 4 digits.")
+    if not data.get("headshot"):
+        errors.append("**Headshot** is required.")
+    for key, label in (("headshot", "Headshot"), ("figure_1", "Figure 1"), ("figure_2", "Figure 2")):
+        err = image_error(data.get(key), label)
+        if err:
+            errors.append(err)
+    for n in (1, 2):
+        if data.get(f"figure_{n}") and not get(f"caption_{n}").strip():
+            errors.append(f"Provide a **caption for Figure {n}**.")
+    return errors
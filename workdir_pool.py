@@ -0,0 +1,117 @@
+"""
+workdir_pool.py — Reusable compile work directories on a RAM-backed filesystem.
+
+Creating and removing a temp directory per compile on the default temp disk
+costs metadata writes and disk I/O under burst load. Instead, a bounded pool
+of pre-created directories lives under WORKDIR_ROOT (tmpfs /dev/shm when
+available). A directory is emptied when it is returned, and the whole pool is
+removed at process exit. Each process (including forked pool workers, which
+skip atexit handlers) gets its own pool directory and removes it through a
+multiprocessing finalizer.
+"""
+
+import contextlib
+import multiprocessing.util
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+import config as C
+
+
+def _default_root() -> str:
+    """Prefer the tmpfs mount so compile files never touch disk."""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class WorkdirPool:
+    """Bounded pool of empty work directories; overflow falls back to mkdtemp."""
+
+    def __init__(self, root: str, size: int):
+        self.root = root
+        self.size = size
+        self._free = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._base = None
+        self._pid = None
+        self._created = 0
+
+    def _base_dir(self) -> str:
+        if self._pid != os.getpid():
+            # First use in this process, or a forked child holding the parent's pool
+            self._free = queue.SimpleQueue()
+            self._created = 0
+            os.makedirs(self.root, exist_ok=True)
+            self._base = tempfile.mkdtemp(prefix="gsa_workdirs_", dir=self.root)
+            self._pid = os.getpid()
+            # Runs at interpreter exit and when a multiprocessing worker exits
+            multiprocessing.util.Finalize(self, self.close, exitpriority=0)
+        return self._base
+
+    def _take(self):
+        with self._lock:
+            base = self._base_dir()   # Before touching _free: it may be a parent's
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            path = os.path.join(base, f"w{self._created}")
+            self._created += 1
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _reset(path: str) -> None:
+        """Empty a directory in place (cheaper than rmtree + mkdir)."""
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Yield an empty work directory for the duration of the with-block."""
+        try:
+            path = self._take()
+        except OSError:
+            path = None  # RAM-backed root unavailable
+        if path is None:
+            # Pool exhausted: a one-off directory keeps callers unblocked
+            temp_dir = tempfile.mkdtemp()
+            try:
+                yield temp_dir
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        try:
+            yield path
+        finally:
+            try:
+                self._reset(path)
+                self._free.put(path)
+            except OSError:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def close(self) -> None:
+        """Remove this process's pooled directories (also run at exit)."""
+        if self._base is not None and self._pid == os.getpid():
+            shutil.rmtree(self._base, ignore_errors=True)
+            self._base = None
+            self._pid = None
+
+
+# Shared by every compile in this process
+pool = WorkdirPool(C.WORKDIR_ROOT or _default_root(), C.WORKDIR_POOL_SIZE)